@@ -0,0 +1,47 @@
+"""
+Micro-benchmark of CheckDigitCalculator.compute_check_digit against the original per character loop
+
+Run from the repository root:
+    python -m benchmarks.bench_check_digit
+"""
+import timeit
+
+from parser.mrz_parser import CheckDigitCalculator
+
+SAMPLES = {
+    'date': '040315',
+    'doc_number': '12',
+    'composite': '000000012305001<<<<<<<<<<04031513203190123456789<',
+}
+
+
+def legacy_compute_check_digit(data: str) -> str:
+    weights = [7, 3, 1]
+    check_sum = 0
+    for i in range(len(data)):
+        char = data[i]
+        if char.isdigit():
+            check_sum += int(char) * weights[i % 3]
+        elif char.isupper():
+            check_sum += (ord(char) - 55) * weights[i % 3]
+        elif char == '<':
+            check_sum += 0
+    return str(check_sum % 10)
+
+
+def _ns_per_call(fn, data: str, number: int) -> float:
+    best = min(timeit.repeat(lambda: fn(data), number=number, repeat=5))
+    return best / number * 1e9
+
+
+def main(number: int = 100_000):
+    print(f"{'field':<12}{'len':>5}{'before ns':>12}{'after ns':>12}{'speedup':>10}")
+    for name, data in SAMPLES.items():
+        assert legacy_compute_check_digit(data) == CheckDigitCalculator.compute_check_digit(data)
+        before = _ns_per_call(legacy_compute_check_digit, data, number)
+        after = _ns_per_call(CheckDigitCalculator.compute_check_digit, data, number)
+        print(f"{name:<12}{len(data):>5}{before:>12.0f}{after:>12.0f}{before / after:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
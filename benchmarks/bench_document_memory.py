@@ -0,0 +1,94 @@
+"""
+Memory held per parsed Document, compared with the original representation
+(plain dataclasses, list of lines and one Exception, with its traceback, per error)
+
+Run from the repository root:
+    python -m benchmarks.bench_document_memory
+"""
+import datetime
+import gc
+import tracemalloc
+from dataclasses import dataclass
+from typing import List, Optional
+
+from parser.colombian_mrz_parser import ColombianMRZParser
+
+MRZS = [
+    "ICCOL000000012305001<<<<<<<<<<\n0403151F3203190C0L1234567890<5\nWALTEROS<<LAURA<<<<<<<<<<<<",
+    "ICCOL000000012305001<<<<<<<<<<\n0413151F3203190C0L1234567890<0\nWALTEROS<<LAURA<<<<<<<<<<<<",
+]
+
+
+@dataclass()
+class LegacyDocumentFields:
+    bird_date: Optional[datetime.date]
+    sex: str
+    expiration_date: Optional[datetime.date]
+    nationality_country_code: str
+    nationality_country_name: str
+    nuip: str
+    first_names: str
+    last_names: str
+    is_truncated: bool
+    doc_type: str
+    country_code: str
+    country_name: str
+    doc_number: str
+    doc_number_check_digit: str
+    mun_code: str
+    mun_name: str
+    dep_code: str
+    dep_name: str
+    errors: List[BaseException]
+
+
+@dataclass()
+class LegacyDocumentMetadata:
+    lines: List[str]
+    confidence: float
+
+
+@dataclass()
+class LegacyDocument:
+    fields: LegacyDocumentFields
+    metadata: LegacyDocumentMetadata
+
+
+def _raised(message: str) -> Exception:
+    try:
+        raise Exception(message)
+    except Exception as e:
+        return e
+
+
+def _to_legacy(doc) -> LegacyDocument:
+    f = doc.fields
+    values = {name: getattr(f, name) for name in LegacyDocumentFields.__dataclass_fields__ if name != 'errors'}
+    fields = LegacyDocumentFields(errors=[_raised(e.message) for e in f.errors], **values)
+    metadata = LegacyDocumentMetadata(lines=list(doc.metadata.lines), confidence=doc.metadata.confidence)
+    return LegacyDocument(fields=fields, metadata=metadata)
+
+
+def _bytes_per_document(build, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    docs = [build(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(docs) == count
+    return (after - before) / count
+
+
+def main(count: int = 20_000):
+    mrz_parser = ColombianMRZParser()
+    current = _bytes_per_document(lambda i: mrz_parser.parse(MRZS[i % len(MRZS)]), count)
+    legacy = _bytes_per_document(lambda i: _to_legacy(mrz_parser.parse(MRZS[i % len(MRZS)])), count)
+    print(f"{'model':<10}{'bytes/doc':>12}")
+    print(f"{'before':<10}{legacy:>12.0f}")
+    print(f"{'after':<10}{current:>12.0f}")
+    print(f"saved {1 - current / legacy:.0%} with half of the documents carrying errors")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Parse throughput on clean MRZs compared with OCR-damaged ones (bad dates, letters read in digit
+fields, wrong check digits). Validation failures are returned as MRZError values, not raised,
+so the malformed ratio should stay close to 1x
+
+Run from the repository root:
+    python -m benchmarks.bench_malformed_input
+"""
+import timeit
+
+from parser.colombian_mrz_parser import ColombianMRZParser
+
+CLEAN = [
+    "ICCOL000000012305001<<<<<<<<<<\n0403151F3203190C0L1234567890<5\nWALTEROS<<LAURA<<<<<<<<<<<<",
+]
+MALFORMED = [
+    # Month 13 in the bird date, wrong composite digit
+    "ICCOL000000012305001<<<<<<<<<<\n0413151F3203190C0L1234567890<0\nWALTEROS<<LAURA<<<<<<<<<<<<",
+    # O read instead of 0 in both dates
+    "ICCOL000000012305001<<<<<<<<<<\nO403151F32O3190C0L1234567890<5\nWALTEROS<<LAURA<<<<<<<<<<<<",
+    # Wrong doc number and date check digits, February 30th
+    "ICCOL000000012405001<<<<<<<<<<\n0402301F3203180C0L1234567890<5\nWALTEROS<<LAURA<<<<<<<<<<<<",
+    # Letter in the date check digits and the nuip
+    "ICCOL000000012305001<<<<<<<<<<\n040315IF320319BC0L12345678S0<5\nWALTEROS<<LAURA<<<<<<<<<<<<",
+]
+
+
+def _us_per_parse(mrz_parser: ColombianMRZParser, mrzs, number: int) -> float:
+    best = min(timeit.repeat(lambda: [mrz_parser.parse(mrz) for mrz in mrzs], number=number, repeat=5))
+    return best / (number * len(mrzs)) * 1e6
+
+
+def main(number: int = 5_000):
+    mrz_parser = ColombianMRZParser()
+    assert all(not mrz_parser.parse(mrz).fields.errors for mrz in CLEAN)
+    assert all(mrz_parser.parse(mrz).fields.errors for mrz in MALFORMED)
+    clean = _us_per_parse(mrz_parser, CLEAN, number)
+    malformed = _us_per_parse(mrz_parser, MALFORMED, number)
+    print(f"{'input':<12}{'us/parse':>10}{'parses/s':>12}")
+    print(f"{'clean':<12}{clean:>10.2f}{1e6 / clean:>12.0f}")
+    print(f"{'malformed':<12}{malformed:>10.2f}{1e6 / malformed:>12.0f}")
+    print(f"malformed / clean: {malformed / clean:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
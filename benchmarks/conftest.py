@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The synthetic cedula generator is a test helper, test/synthetic.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test'))
@@ -0,0 +1,94 @@
+"""
+Hot path benchmarks on synthetic cedulas, needs pytest-benchmark
+
+Run from the repository root:
+    python -m pytest benchmarks/test_bench_pipeline.py --benchmark-only
+Compare against a saved run with --benchmark-autosave / --benchmark-compare
+"""
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from parser.colombian_mrz_parser import ColombianMRZParser
+from parser.mrz_correction import MRZCorrector
+from scanner.textract_analyzer import S3Client, TextractClient, TextractColCedulaMRZAnalyzer
+from scanner.textract_mrz import extract_mrz_from_response
+from synthetic import SyntheticCedulaGenerator
+
+BATCH_SIZE = 1000
+
+
+class _CannedTextractClient(TextractClient):
+    supports_inline_bytes = True
+
+    def __init__(self, response: dict):
+        self._response = response
+
+    def analyze_id(self, file_name, bucket_name):
+        return self._response
+
+    def analyze_id_bytes(self, file: bytes):
+        return self._response
+
+
+class _MemoryS3Client(S3Client):
+    supports_delete = True
+
+    def put_object(self, bucket, key, body):
+        pass
+
+    def delete_object(self, bucket, key):
+        pass
+
+
+@pytest.fixture(scope='module')
+def generator():
+    return SyntheticCedulaGenerator(seed=42)
+
+
+@pytest.fixture(scope='module')
+def valid_mrzs(generator):
+    return generator.batch(BATCH_SIZE)
+
+
+@pytest.fixture(scope='module')
+def corrupted_mrzs(generator):
+    return generator.batch(BATCH_SIZE, corrupted_ratio=1.0)
+
+
+def _parse_all(mrz_parser, mrzs):
+    return sum(not mrz_parser.parse(mrz).fields.errors for mrz in mrzs)
+
+
+def test_parse_valid(benchmark, valid_mrzs):
+    assert benchmark(_parse_all, ColombianMRZParser(), valid_mrzs) == len(valid_mrzs)
+
+
+def test_parse_corrupted(benchmark, corrupted_mrzs):
+    benchmark(_parse_all, ColombianMRZParser(), corrupted_mrzs)
+
+
+def test_parse_corrupted_with_corrector(benchmark, corrupted_mrzs):
+    benchmark(_parse_all, ColombianMRZParser(corrector=MRZCorrector()), corrupted_mrzs)
+
+
+def test_parse_batch_valid(benchmark, valid_mrzs):
+    mrz_parser = ColombianMRZParser()
+    batch = benchmark(mrz_parser.parse_batch, valid_mrzs)
+    assert batch.valid.all()
+
+
+def test_extract_from_textract_response(benchmark, generator, valid_mrzs):
+    responses = [generator.textract_response(mrz) for mrz in valid_mrzs[:100]]
+    results = benchmark(lambda: [extract_mrz_from_response(response) for response in responses])
+    assert [r.text for r in results] == valid_mrzs[:100]
+
+
+def test_textract_analyzer_end_to_end(benchmark, generator, valid_mrzs):
+    analyzer = TextractColCedulaMRZAnalyzer(
+        _CannedTextractClient(generator.textract_response(valid_mrzs[0])), _MemoryS3Client(), 'bucket_name',
+        ColombianMRZParser(corrector=MRZCorrector()),
+    )
+    image = b'\x89PNG' + bytes(200 * 1024)
+    document = benchmark(analyzer.analyze_document_id, image)
+    assert document.fields.errors == ()
@@ -0,0 +1,83 @@
+"""
+Analyze a directory, zip or tar of cédula images offline and write one result per image
+
+    python bulk.py archive.tar.gz -o results.jsonl --backend local --workers 8
+
+Re-running the same command after a crash skips the images already written.
+The exit status is 1 when any image failed.
+With --backend replay the input is a directory of stored Textract AnalyzeID responses (.json) or an NDJSON
+file of them, they are extracted and parsed again without calling AWS:
+
+    python bulk.py responses.ndjson -o reparsed.jsonl --backend replay --workers 16
+"""
+import argparse
+import functools
+import sys
+
+from scanner.bulk import Checkpoint, JSONLResultWriter, ParquetResultWriter, iter_documents, run_bulk
+
+
+def _create_analyzer_factory(backend: str, correct_ocr: bool = False):
+    # The factories are module level functions, so they can be sent to worker processes
+    if backend == 'replay':
+        from scanner.textract_replay import create_replay_analyzer
+        return functools.partial(create_replay_analyzer, correct_ocr=correct_ocr)
+    from scanner import factories
+    if backend == 'local':
+        return factories.create_local_analyzer
+    if backend == 'textract':
+        return factories.create_textract_analyzer
+    raise Exception(f"Unknown backend {backend}")
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('input', help='directory, .zip or .tar(.gz) with the images, '
+                                          'or directory / NDJSON file of stored responses for replay')
+    arg_parser.add_argument('-o', '--output', required=True, help='JSONL file, or directory of part files for parquet')
+    arg_parser.add_argument('--format', choices=('jsonl', 'parquet'), default='jsonl')
+    arg_parser.add_argument('--backend', choices=('local', 'textract', 'replay'), default='local')
+    arg_parser.add_argument('--workers', type=int, default=4)
+    arg_parser.add_argument('--executor', choices=('process', 'thread'),
+                            help='defaults to threads for textract and processes for the other backends')
+    arg_parser.add_argument('--max-in-flight', type=int, help='images read but not written yet, default 2 x workers')
+    arg_parser.add_argument('--checkpoint', help='list of finished images, default OUTPUT.checkpoint')
+    arg_parser.add_argument('--retry-failed', action='store_true', help='analyze again images that failed before')
+    arg_parser.add_argument('--ocr-correction', action='store_true',
+                            help='replay only: correct OCR confusions confirmed by the check digits')
+    args = arg_parser.parse_args(argv)
+
+    executor = args.executor or ('thread' if args.backend == 'textract' else 'process')
+    checkpoint = Checkpoint(args.checkpoint or f'{args.output.rstrip("/")}.checkpoint', retry_failed=args.retry_failed)
+    if args.format == 'parquet':
+        writer = ParquetResultWriter(args.output)
+    else:
+        writer = JSONLResultWriter(args.output)
+
+    def progress(record: dict):
+        print(f'{record["status"]} {record["filename"]}', file=sys.stderr)
+
+    if args.backend == 'replay':
+        from scanner.textract_replay import iter_stored_responses
+        items = iter_stored_responses(args.input, skip=checkpoint.is_done)
+    else:
+        items = iter_documents(args.input, skip=checkpoint.is_done)
+    try:
+        stats = run_bulk(
+            items,
+            _create_analyzer_factory(args.backend, correct_ocr=args.ocr_correction),
+            writer,
+            checkpoint=checkpoint,
+            use_processes=executor == 'process',
+            workers=args.workers,
+            max_in_flight=args.max_in_flight,
+            on_record=progress,
+        )
+    finally:
+        checkpoint.close()
+    print(f'analyzed {stats.analyzed}, failed {stats.failed}', file=sys.stderr)
+    return 1 if stats.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
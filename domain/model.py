@@ -1,10 +1,87 @@
 import datetime
 from dataclasses import dataclass
-from enum import StrEnum
-from typing import Optional, List
+from enum import IntEnum, StrEnum
+from typing import NamedTuple, Optional, Tuple
 
 
-@dataclass()
+class ErrorCode(IntEnum):
+    INVALID_DOC_TYPE = 1
+    INVALID_COUNTRY = 2
+    DOC_NUMBER_NOT_NUMERIC = 3
+    DOC_NUMBER_CHECK_DIGIT_NOT_NUMERIC = 4
+    DOC_NUMBER_CHECK_DIGIT_MISMATCH = 5
+    MUN_CODE_NOT_NUMERIC = 6
+    DEP_CODE_NOT_NUMERIC = 7
+    DATE_YEAR_NOT_NUMERIC = 8
+    DATE_MONTH_NOT_NUMERIC = 9
+    DATE_DAY_NOT_NUMERIC = 10
+    INVALID_DATE = 11
+    DATE_CHECK_DIGIT_NOT_NUMERIC = 12
+    DATE_CHECK_DIGIT_MISMATCH = 13
+    EXPIRATION_DATE_CHECK_DIGIT_NOT_NUMERIC = 14
+    EXPIRATION_DATE_CHECK_DIGIT_MISMATCH = 15
+    INVALID_NATIONALITY = 16
+    NUIP_NOT_NUMERIC = 17
+    COMPOSITE_CHECK_DIGIT_MISSING = 18
+    COMPOSITE_CHECK_DIGIT_MISMATCH = 19
+    INVALID_LOCALITY = 20
+    LINE_TOO_SHORT = 21
+
+
+_ERROR_MESSAGES = {
+    ErrorCode.INVALID_DOC_TYPE: 'Invalid document type',
+    ErrorCode.INVALID_COUNTRY: 'Invalid country',
+    ErrorCode.DOC_NUMBER_NOT_NUMERIC: 'Invalid document number is not numeric',
+    ErrorCode.DOC_NUMBER_CHECK_DIGIT_NOT_NUMERIC: 'Invalid document number check digit is not numeric',
+    ErrorCode.DOC_NUMBER_CHECK_DIGIT_MISMATCH: 'Invalid document number check digit {0} expected {1}',
+    ErrorCode.MUN_CODE_NOT_NUMERIC: 'Invalid municipality is not numeric',
+    ErrorCode.DEP_CODE_NOT_NUMERIC: 'Invalid department is not numeric',
+    ErrorCode.DATE_YEAR_NOT_NUMERIC: 'Invalid {0} year is not numeric',
+    ErrorCode.DATE_MONTH_NOT_NUMERIC: 'Invalid {0} month is not numeric',
+    ErrorCode.DATE_DAY_NOT_NUMERIC: 'Invalid {0} day is not numeric',
+    ErrorCode.INVALID_DATE: 'Invalid {0}',
+    ErrorCode.DATE_CHECK_DIGIT_NOT_NUMERIC: 'Invalid {0} check digit is not numeric',
+    ErrorCode.DATE_CHECK_DIGIT_MISMATCH: 'Invalid {0} check digit {1} expected {2}',
+    ErrorCode.EXPIRATION_DATE_CHECK_DIGIT_NOT_NUMERIC: 'Invalid expiration date check digit is not numeric',
+    ErrorCode.EXPIRATION_DATE_CHECK_DIGIT_MISMATCH: 'Invalid expiration date check digit {0} expected {1}',
+    ErrorCode.INVALID_NATIONALITY: 'Invalid nationality {0}',
+    ErrorCode.NUIP_NOT_NUMERIC: 'Invalid nuip is not numeric: {0}',
+    ErrorCode.COMPOSITE_CHECK_DIGIT_MISSING: 'Missing composite check digit',
+    ErrorCode.COMPOSITE_CHECK_DIGIT_MISMATCH: 'Invalid composite check digit {0} expected {1}',
+    ErrorCode.INVALID_LOCALITY: 'Invalid municipality {0} and department {1}',
+    ErrorCode.LINE_TOO_SHORT: 'Line {0} has {1} characters expected 30',
+}
+
+
+class MRZError(NamedTuple):
+    """
+    Validation error found while parsing, stored as a code plus the values needed for its message.
+    The message is only formatted when it is read
+    """
+    code: ErrorCode
+    args: Tuple = ()
+
+    @property
+    def message(self) -> str:
+        return 'Invalid MRZ format: ' + _ERROR_MESSAGES[self.code].format(*self.args)
+
+    def __str__(self) -> str:
+        return self.message
+
+
+class MRZCorrection(NamedTuple):
+    """
+    Character replaced by the OCR correction stage before parsing, or only suggested when
+    no check digit confirms the replacement (applied is False, the parsed fields keep the original)
+    """
+    line: int
+    position: int
+    original: str
+    replacement: str
+    applied: bool = True
+
+
+@dataclass(slots=True, frozen=True)
 class DocumentFields:
     bird_date: Optional[datetime.date]
     sex: str
@@ -27,16 +104,21 @@ class DocumentFields:
     dep_code: str
     dep_name: str
 
-    errors: List[BaseException]
+    errors: Tuple[MRZError, ...]
+    # Failed checks that issued cards are known to fail too, they do not lower the confidence
+    warnings: Tuple[MRZError, ...] = ()
 
 
-@dataclass()
+@dataclass(slots=True, frozen=True)
 class DocumentMetadata:
-    lines: List[str]
+    lines: Tuple[str, ...]
     confidence: float
+    corrections: Tuple[MRZCorrection, ...] = ()
+    # Lowest confidence the OCR gave the MRZ lines (0-100), None when the OCR does not report one
+    ocr_confidence: Optional[float] = None
 
 
-@dataclass()
+@dataclass(slots=True, frozen=True)
 class Document:
     fields: DocumentFields
     metadata: DocumentMetadata
@@ -0,0 +1,153 @@
+import datetime
+import json
+from dataclasses import fields
+from enum import Enum
+from typing import Any, Callable, List, Tuple
+
+from domain.model import Document, DocumentFields, DocumentMetadata, ErrorCode, MRZCorrection, MRZError, Sex
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _date(value):
+    return value.isoformat() if value is not None else None
+
+
+def _errors(errors) -> List[dict]:
+    return [{"code": e.code.name, "args": list(e.args)} for e in errors]
+
+
+def _corrections(corrections) -> List[dict]:
+    return [c._asdict() for c in corrections]
+
+
+def _identity(value):
+    return value
+
+
+def _str(value):
+    return str(value)
+
+
+# Converter per field, resolved once from the dataclass definitions so rendering is a flat loop in field order
+_FIELD_CONVERTERS = {
+    'bird_date': _date,
+    'expiration_date': _date,
+    'sex': _str,
+    'errors': _errors,
+    'warnings': _errors,
+}
+_DOCUMENT_FIELDS: Tuple[Tuple[str, Callable], ...] = tuple(
+    (f.name, _FIELD_CONVERTERS.get(f.name, _identity)) for f in fields(DocumentFields)
+)
+_METADATA_CONVERTERS = {
+    'lines': list,
+    'corrections': _corrections,
+}
+_METADATA_FIELDS: Tuple[Tuple[str, Callable], ...] = tuple(
+    (f.name, _METADATA_CONVERTERS.get(f.name, _identity)) for f in fields(DocumentMetadata)
+)
+
+
+def document_fields_to_dict(document_fields: DocumentFields) -> dict:
+    return {name: convert(getattr(document_fields, name)) for name, convert in _DOCUMENT_FIELDS}
+
+
+def document_to_dict(document: Document) -> dict:
+    """
+    :return: JSON ready dict, dates as ISO strings and errors as {"code", "args"}
+    """
+    return {
+        "fields": document_fields_to_dict(document.fields),
+        "metadata": {name: convert(getattr(document.metadata, name)) for name, convert in _METADATA_FIELDS},
+    }
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value) if value is not None else None
+
+
+def _parse_sex(value):
+    return _SEX_BY_VALUE.get(value, value)
+
+
+def _parse_errors(values) -> Tuple[MRZError, ...]:
+    return tuple(MRZError(ErrorCode[e["code"]], tuple(e["args"])) for e in values)
+
+
+def _parse_corrections(values) -> Tuple[MRZCorrection, ...]:
+    return tuple(MRZCorrection(**c) for c in values)
+
+
+_SEX_BY_VALUE = {sex.value: sex for sex in Sex}
+_FIELD_PARSERS = {
+    'bird_date': _parse_date,
+    'expiration_date': _parse_date,
+    'sex': _parse_sex,
+    'errors': _parse_errors,
+    'warnings': _parse_errors,
+}
+_METADATA_PARSERS = {
+    'lines': tuple,
+    'corrections': _parse_corrections,
+}
+
+
+def document_from_dict(data: dict) -> Document:
+    """
+    Rebuild a Document from the output of document_to_dict, fields missing from data keep their default
+    """
+    document_fields = data["fields"]
+    metadata = data["metadata"]
+    return Document(
+        fields=DocumentFields(**{
+            name: _FIELD_PARSERS.get(name, _identity)(document_fields[name])
+            for name, _ in _DOCUMENT_FIELDS if name in document_fields
+        }),
+        metadata=DocumentMetadata(**{
+            name: _METADATA_PARSERS.get(name, _identity)(metadata[name])
+            for name, _ in _METADATA_FIELDS if name in metadata
+        }),
+    )
+
+
+def _default(obj: Any):
+    if isinstance(obj, Document):
+        return document_to_dict(obj)
+    if isinstance(obj, DocumentFields):
+        return document_fields_to_dict(obj)
+    if isinstance(obj, MRZError):
+        return {"code": obj.code.name, "args": list(obj.args)}
+    if isinstance(obj, MRZCorrection):
+        return obj._asdict()
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, BaseException):
+        return str(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(content: Any) -> bytes:
+        """
+        Serialize content that may hold Documents to compact JSON bytes
+        """
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(content: Any) -> bytes:
+        """
+        Serialize content that may hold Documents to compact JSON bytes
+        """
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(data: bytes) -> Any:
+        return json.loads(data)
@@ -1,15 +1,22 @@
 import datetime
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional
 
-from iso3166 import countries
+from domain.model import DocumentFields, Sex, DocumentMetadata, ErrorCode, MRZError
+from parser.country_table import get_country_table
+from parser.locality_registry import get_locality_registry
+from parser.mrz_parser import CheckDigitCalculator, MRZParser, Document
 
-from domain.model import DocumentFields, Sex, DocumentMetadata
-from parser.locatilities import LOCALITIES
-from parser.mrz_parser import MRZParser, Document
+if TYPE_CHECKING:
+    from parser.mrz_correction import MRZCorrector
 
+# Confidence lost per character changed by the MRZCorrector, suggestions cost nothing
+CORRECTION_CONFIDENCE_PENALTY = 5.0
+# Length of the first two TD1 lines, the name line is often trimmed and is not held to it
+_LINE_LENGTH = 30
 
-@dataclass()
+
+@dataclass(slots=True)
 class _MRZL1:
     doc_type: str
     country_code: str
@@ -21,10 +28,10 @@ class _MRZL1:
     dep_code: str
     dep_name: str
     confidence: float
-    errors: List[BaseException]
+    errors: List[MRZError]
 
 
-@dataclass()
+@dataclass(slots=True)
 class _MRZL2:
     bird_date: Optional[datetime.date]
     sex: str
@@ -33,10 +40,10 @@ class _MRZL2:
     nationality_country_name: str
     nuip: str
     confidence: float
-    errors: List[BaseException]
+    errors: List[MRZError]
 
 
-@dataclass()
+@dataclass(slots=True)
 class _MRZL3:
     first_names: str
     last_names: str
@@ -50,99 +57,155 @@ class ColombianMRZParser(MRZParser):
     The MRZ string is broken down into 3 lines, each of which is parsed separately.
     """
 
+    def __init__(self, corrector: Optional['MRZCorrector'] = None):
+        """
+        :param corrector: repairs OCR misreadings of the numeric fields before parsing, see MRZCorrector
+        """
+        self._corrector = corrector
+
     def parse(self, mrz: str) -> Document:
         lines = mrz.strip().replace(' ', '').split('\n')
         if len(lines) != 3:
             raise Exception('Invalid MRZ format: Invalid number of lines')
-        return self._parse_by_lines(lines[0], lines[1], lines[2])
+        if self._corrector is None:
+            return self._parse_by_lines(lines[0], lines[1], lines[2])
+        l1, l2, corrections = self._corrector.correct(lines[0], lines[1])
+        document = self._parse_by_lines(l1, l2, lines[2])
+        if not corrections:
+            return document
+        applied = sum(correction.applied for correction in corrections)
+        metadata = replace(
+            document.metadata, corrections=corrections,
+            confidence=document.metadata.confidence - CORRECTION_CONFIDENCE_PENALTY * applied,
+        )
+        return replace(document, metadata=metadata)
+
+    def parse_many(self, mrzs: Iterable[str]) -> Iterator[Document]:
+        """
+        Parse a stream of MRZ strings one by one, see parse_batch for the columnar version
+        """
+        for mrz in mrzs:
+            yield self.parse(mrz)
+
+    def parse_batch(self, lines, with_documents: bool = False):
+        """
+        Parse many MRZ triplets at once with array operations
+        :param lines: a (N, 3) numpy array of 30-char lines or an iterable of MRZ strings
+        :param with_documents: also return a Document per row
+        :return: parser.mrz_batch.MRZBatch
+        """
+        from parser.mrz_batch import parse_batch
+        return parse_batch(lines, with_documents=with_documents, mrz_parser=self)
 
     @classmethod
     def _parse_by_lines(cls, l1: str, l2: str, l3: str) -> Document:
-        parsed_l1 = cls._parse_mrz_l1(l1)
-        parsed_l2 = cls._parse_mrz_l2(l2)
+        # Short lines are reported and padded with fillers, so every field can still be read
+        short_lines = [MRZError(ErrorCode.LINE_TOO_SHORT, (number, len(line)))
+                       for number, line in ((1, l1), (2, l2)) if len(line) < _LINE_LENGTH]
+        parsed_l1 = cls._parse_mrz_l1(l1.ljust(_LINE_LENGTH, '<'))
+        parsed_l2 = cls._parse_mrz_l2(l2.ljust(_LINE_LENGTH, '<'))
         parsed_l3 = cls._parse_mrz_l3(l3)
+        errors = short_lines + parsed_l1.errors + parsed_l2.errors
+        confidence = min(parsed_l1.confidence, parsed_l2.confidence) - 30.0 * len(short_lines)
+        # Issued cedulas do not always carry a valid TD1 composite digit (the card in test/data/fake_1.png
+        # reads 0 where 5 is expected) so a mismatch is only a warning, the per field digits are the real check
+        composite_error = cls._validate_composite_check_digit(l1, l2)
+        warnings = (composite_error,) if composite_error is not None else ()
         fields = DocumentFields(
             bird_date=parsed_l2.bird_date,
             sex=Sex.parse(parsed_l2.sex),
             expiration_date=parsed_l2.expiration_date,
             nationality_country_code=parsed_l2.nationality_country_code,
-            nationality_country_name=parsed_l2.nationality_country_name.upper(),
+            nationality_country_name=parsed_l2.nationality_country_name,
             nuip=parsed_l2.nuip,
             first_names=parsed_l3.first_names,
             last_names=parsed_l3.last_names,
             is_truncated=parsed_l3.is_truncated,
             doc_type=parsed_l1.doc_type,
             country_code=parsed_l1.country_code,
-            country_name=parsed_l1.country_name.upper(),
+            country_name=parsed_l1.country_name,
             doc_number=parsed_l1.doc_number,
             doc_number_check_digit=parsed_l1.doc_number_check_digit,
             mun_code=parsed_l1.mun_code,
             mun_name=parsed_l1.mun_name,
             dep_code=parsed_l1.dep_code,
             dep_name=parsed_l1.dep_name,
-            errors=parsed_l1.errors + parsed_l2.errors,
+            errors=tuple(errors),
+            warnings=warnings,
         )
         metadata = DocumentMetadata(
-            lines=[l1, l2, l3],
-            confidence=min(parsed_l1.confidence, parsed_l2.confidence),
+            lines=(l1, l2, l3),
+            confidence=confidence,
         )
         return Document(fields=fields, metadata=metadata)
 
+    @classmethod
+    def _validate_composite_check_digit(cls, l1: str, l2: str) -> Optional[MRZError]:
+        if len(l1) < _LINE_LENGTH or len(l2) < _LINE_LENGTH:
+            return MRZError(ErrorCode.COMPOSITE_CHECK_DIGIT_MISSING)
+        composite_check_digit = l2[29]
+        calculated_check_digit = CheckDigitCalculator.compute_composite_check_digit(l1, l2)
+        if composite_check_digit != calculated_check_digit:
+            return MRZError(ErrorCode.COMPOSITE_CHECK_DIGIT_MISMATCH, (composite_check_digit, calculated_check_digit))
+        return None
+
     @classmethod
     def _parse_mrz_l1(cls, l1: str) -> _MRZL1:
-        errors: List[Exception] = []
+        errors: List[MRZError] = []
         confidence = 100
         doc_type = l1[0].upper()
         if doc_type in ['L', 'l', "1", "|"]:
             doc_type = 'I'
         if doc_type not in ['A', 'C', 'I']:
-            errors.append(Exception('Invalid MRZ format: Invalid document type'))
+            errors.append(MRZError(ErrorCode.INVALID_DOC_TYPE))
         if l1[1] in ['C', '<']:
             confidence += 10.0
         raw_country = l1[2:5]
-        c = countries.get(raw_country.upper().replace("0", "O"))
-        if c is None:
+        country = get_country_table().get(raw_country)
+        if country is None:
             confidence -= 10.0
-            errors.append(Exception('Invalid MRZ format: Invalid country'))
-        country_name = c.name
-        country_code = c.alpha3
+            errors.append(MRZError(ErrorCode.INVALID_COUNTRY))
+            country_code = raw_country
+            country_name = ''
+        else:
+            country_code = country.code
+            country_name = country.name
 
         doc_number = l1[5:14].lstrip('0')
         if not doc_number.isnumeric():
             confidence -= 30.0
-            errors.append(Exception('Invalid MRZ format: Invalid document number is not numeric'))
+            errors.append(MRZError(ErrorCode.DOC_NUMBER_NOT_NUMERIC))
         if len(doc_number) > len(doc_number) and l1[5] == '0':
             confidence += 10.0
         doc_number_check_digit = l1[14]
         if not doc_number_check_digit.isnumeric():
             confidence -= 10.0
-            errors.append(Exception('Invalid MRZ format: Invalid document number check digit is not numeric'))
+            errors.append(MRZError(ErrorCode.DOC_NUMBER_CHECK_DIGIT_NOT_NUMERIC))
         calculated_check_digit = cls._calculate_check_digit(doc_number)
         if doc_number_check_digit != calculated_check_digit:
             confidence -= 10.0
-            errors.append(Exception(f'Invalid MRZ format: Invalid document number check digit {doc_number_check_digit} '
-                                    f'expected {calculated_check_digit}'))
+            errors.append(MRZError(ErrorCode.DOC_NUMBER_CHECK_DIGIT_MISMATCH,
+                                   (doc_number_check_digit, calculated_check_digit)))
         mun_code = l1[15:17]
         dep_code = l1[17:20]
         is_valid_location = True
         if not mun_code.isnumeric():
             confidence -= 10.0
-            errors.append(Exception('Invalid MRZ format: Invalid municipality is not numeric'))
+            errors.append(MRZError(ErrorCode.MUN_CODE_NOT_NUMERIC))
             is_valid_location = False
         if not dep_code.isnumeric():
-            errors.append(Exception('Invalid MRZ format: Invalid department is not numeric'))
+            errors.append(MRZError(ErrorCode.DEP_CODE_NOT_NUMERIC))
             is_valid_location = False
         mun_name = ''
         dep_name = ''
         if is_valid_location:
-            for loc in LOCALITIES:
-                if loc[0] == mun_code and loc[1] == dep_code:
-                    mun_name = loc[2]
-                    dep_name = loc[3]
-                    break
+            loc = get_locality_registry().get(mun_code, dep_code)
+            if loc is not None:
+                mun_name = loc.mun_name
+                dep_name = loc.dep_name
         if mun_name == '':
             confidence -= 10.0
-            raise Exception('Invalid MRZ format: Invalid municipality and department')
+            errors.append(MRZError(ErrorCode.INVALID_LOCALITY, (mun_code, dep_code)))
         return _MRZL1(
             doc_type=doc_type,
             country_code=country_code,
@@ -159,45 +222,42 @@ class ColombianMRZParser(MRZParser):
 
     @classmethod
     def _parse_mrz_l2(cls, l2: str) -> _MRZL2:
-        errors: List[Exception] = []
+        errors: List[MRZError] = []
         confidence = 100.0
-        bird_date = None
-        try:
-            bird_date = cls._parse_date(l2[0:6], l2[6], True, 'bird_date')
-        except Exception as e:
+        bird_date, error = cls._parse_date(l2[0:6], l2[6], True, 'bird_date')
+        if error is not None:
             confidence -= 10.0
-            errors.append(e)
+            errors.append(error)
         sex_str = l2[7]
         sex = Sex.parse(sex_str)
         expiration_date_str = l2[8:14]
-        expiration_date = None
-        try:
-            validator_digit = l2[14]
-            expiration_date = cls._parse_date(expiration_date_str, validator_digit, False, 'expiration_date')
-        except Exception as e:
+        expiration_date, error = cls._parse_date(expiration_date_str, l2[14], False, 'expiration_date')
+        if error is not None:
             confidence -= 10.0
-            errors.append(e)
+            errors.append(error)
         expiration_date_check_digit = l2[14]
         if not expiration_date_check_digit.isnumeric():
             confidence -= 10.0
-            errors.append(Exception('Invalid MRZ format: Invalid expiration date check digit is not numeric'))
+            errors.append(MRZError(ErrorCode.EXPIRATION_DATE_CHECK_DIGIT_NOT_NUMERIC))
         calculated_check_digit = cls._calculate_check_digit(expiration_date_str)
         if expiration_date_check_digit != calculated_check_digit:
             confidence -= 10.0
-            errors.append(
-                Exception(f'Invalid MRZ format: Invalid expiration date check digit {expiration_date_check_digit} '
-                          f'expected {calculated_check_digit}'))
-        nationality_str = l2[15:18].replace("0", "O")
-        c = countries.get(nationality_str.upper())
-        if c is None:
+            errors.append(MRZError(ErrorCode.EXPIRATION_DATE_CHECK_DIGIT_MISMATCH,
+                                   (expiration_date_check_digit, calculated_check_digit)))
+        nationality_str = l2[15:18]
+        nationality = get_country_table().get(nationality_str)
+        if nationality is None:
             confidence -= 10.0
-            errors.append(Exception(f'Invalid MRZ format: Invalid nationality {nationality_str}'))
-        nationality_name = c.name
-        nationality_code = c.alpha3
+            errors.append(MRZError(ErrorCode.INVALID_NATIONALITY, (nationality_str,)))
+            nationality_code = nationality_str
+            nationality_name = ''
+        else:
+            nationality_code = nationality.code
+            nationality_name = nationality.name
         nuip = l2[18:28].lstrip('0')
         if not nuip.isnumeric():
             confidence -= 30.0
-            errors.append(Exception(f'Invalid MRZ format: Invalid nuip is not numeric: {nuip}'))
+            errors.append(MRZError(ErrorCode.NUIP_NOT_NUMERIC, (nuip,)))
         return _MRZL2(
             bird_date=bird_date,
             sex=sex,
@@ -214,10 +274,8 @@ class ColombianMRZParser(MRZParser):
         l2 = l2.rstrip('<')
         names = l2.split('<<')
         last_names = names[0].replace('<', ' ')
-        is_truncated = False
-        if len(names) < 2:
-            is_truncated = True
-        first_names = names[1].replace('<', ' ')
+        is_truncated = len(names) < 2
+        first_names = names[1].replace('<', ' ') if len(names) > 1 else ''
         return _MRZL3(
             last_names=last_names,
             first_names=first_names,
@@ -0,0 +1,54 @@
+import functools
+import itertools
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional
+
+# Digits OCR commonly reads in place of the letters of an alpha-3 code
+_OCR_CONFUSIONS = {'O': '0', 'I': '1', 'B': '8'}
+_OCR_FOLD = str.maketrans({digit: letter for letter, digit in _OCR_CONFUSIONS.items()})
+
+
+@dataclass(frozen=True)
+class Country:
+    code: str
+    name: str
+
+
+class CountryTable:
+    """
+    alpha-3 code -> Country with the name already uppercased.
+    Every OCR misreading of a code (e.g. "C0L", "B0L" or "8OL") is a key of its own,
+    so a lookup is a single dictionary hit and an unknown code is a miss
+    """
+
+    def __init__(self, countries: Iterable[Country]):
+        by_key: Dict[str, Country] = {}
+        for country in countries:
+            options = [(char, _OCR_CONFUSIONS[char]) if char in _OCR_CONFUSIONS else (char,)
+                       for char in country.code]
+            for key in itertools.product(*options):
+                by_key[''.join(key)] = country
+        self._by_key: Mapping[str, Country] = MappingProxyType(by_key)
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def get(self, code: str) -> Optional[Country]:
+        """
+        :param code: alpha-3 code as read from the MRZ, e.g. "COL" or "C0L"
+        :return: the country or None
+        """
+        country = self._by_key.get(code)
+        if country is None:
+            country = self._by_key.get(code.upper().translate(_OCR_FOLD))
+        return country
+
+
+@functools.lru_cache(maxsize=None)
+def get_country_table() -> CountryTable:
+    """
+    Build the table on first use, iso3166 builds its whole database on import
+    """
+    from iso3166 import countries
+    return CountryTable(Country(code=c.alpha3, name=c.name.upper()) for c in countries)
@@ -0,0 +1,79 @@
+import functools
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Locality:
+    mun_code: str
+    dep_code: str
+    mun_name: str
+    dep_name: str
+
+
+class LocalityRegistry:
+    """
+    Read-only, indexed view of the LOCALITIES table.
+    All lookups are dictionary hits, the table is only walked once when the registry is built.
+    """
+
+    def __init__(self, rows):
+        by_codes: Dict[Tuple[str, str], Locality] = {}
+        by_mun_code: Dict[str, List[Locality]] = {}
+        by_name: Dict[str, List[Locality]] = {}
+        for row in rows:
+            loc = Locality(mun_code=row[0], dep_code=row[1], mun_name=row[2], dep_name=row[3])
+            by_codes[(loc.mun_code, loc.dep_code)] = loc
+            by_mun_code.setdefault(loc.mun_code, []).append(loc)
+            by_name.setdefault(loc.dep_name, []).append(loc)
+            if loc.mun_name != loc.dep_name:
+                by_name.setdefault(loc.mun_name, []).append(loc)
+        self._by_codes: Mapping[Tuple[str, str], Locality] = MappingProxyType(by_codes)
+        self._by_mun_code: Mapping[str, Tuple[Locality, ...]] = MappingProxyType(
+            {k: tuple(v) for k, v in by_mun_code.items()}
+        )
+        self._by_name: Mapping[str, Tuple[Locality, ...]] = MappingProxyType(
+            {k: tuple(v) for k, v in by_name.items()}
+        )
+
+    def __len__(self) -> int:
+        return len(self._by_codes)
+
+    def __contains__(self, codes: Tuple[str, str]) -> bool:
+        return codes in self._by_codes
+
+    def get(self, mun_code: str, dep_code: str) -> Optional[Locality]:
+        """
+        :param mun_code: e.g. "05"
+        :param dep_code: e.g. "001"
+        :return: the locality registered for the code pair or None
+        """
+        return self._by_codes.get((mun_code, dep_code))
+
+    def by_mun_code(self, mun_code: str) -> Tuple[Locality, ...]:
+        """
+        :param mun_code: e.g. "05", the first column of LOCALITIES (department level group)
+        :return: every locality sharing the code, in table order
+        """
+        return self._by_mun_code.get(mun_code, ())
+
+    def by_name(self, name: str) -> Tuple[Locality, ...]:
+        """
+        :param name: e.g. "CARTAGENA", matched against both mun_name and dep_name
+        :return: every locality with that name, in table order
+        """
+        return self._by_name.get(name.upper(), ())
+
+    @property
+    def codes(self) -> Mapping[Tuple[str, str], Locality]:
+        return self._by_codes
+
+
+@functools.lru_cache(maxsize=None)
+def get_locality_registry() -> LocalityRegistry:
+    """
+    Build the registry on first use so that importing the parser does not pay for it
+    """
+    from parser.locatilities import LOCALITIES
+    return LocalityRegistry(LOCALITIES)
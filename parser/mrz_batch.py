@@ -0,0 +1,287 @@
+from dataclasses import dataclass, fields
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+
+from domain.model import Document
+from parser.country_table import get_country_table
+from parser.locality_registry import get_locality_registry
+from parser.mrz_dates import get_date_decoder
+
+MRZ_LINE_LENGTH = 30
+
+_WEIGHTS = np.array([7, 3, 1], dtype=np.int64)
+
+# Character value per byte, same rules as CheckDigitCalculator: digits are their value,
+# uppercase letters are 10..35 and everything else ('<', lowercase, noise) counts as 0
+_CHAR_VALUES = np.zeros(256, dtype=np.int64)
+_CHAR_VALUES[ord('0'):ord('9') + 1] = np.arange(10)
+_CHAR_VALUES[ord('A'):ord('Z') + 1] = np.arange(10, 36)
+
+
+@dataclass()
+class MRZBatch:
+    """
+    Columnar result of parse_batch, every array has one entry per input row.
+    The *_valid columns flag the rows where the scalar parser reports the matching errors
+    """
+    # First two lines hold 30 chars, short ones are zero padded by to_char_matrix
+    line_length_valid: np.ndarray
+    doc_type: np.ndarray
+    doc_type_valid: np.ndarray
+    country_code: np.ndarray
+    country_name: np.ndarray
+    country_valid: np.ndarray
+    doc_number: np.ndarray
+    doc_number_valid: np.ndarray
+    mun_code: np.ndarray
+    mun_name: np.ndarray
+    dep_code: np.ndarray
+    dep_name: np.ndarray
+    location_valid: np.ndarray
+    bird_date: np.ndarray
+    bird_date_valid: np.ndarray
+    sex: np.ndarray
+    expiration_date: np.ndarray
+    expiration_date_valid: np.ndarray
+    composite_valid: np.ndarray
+    nationality_country_code: np.ndarray
+    nationality_country_name: np.ndarray
+    nationality_valid: np.ndarray
+    nuip: np.ndarray
+    nuip_valid: np.ndarray
+    last_names: np.ndarray
+    first_names: np.ndarray
+    documents: Optional[List[Document]] = None
+
+    def __len__(self) -> int:
+        return len(self.doc_number)
+
+    @property
+    def valid(self) -> np.ndarray:
+        """
+        True for the rows whose Document has no errors. composite_valid is left out, the scalar parser only
+        reports a composite mismatch as a warning
+        """
+        return (self.line_length_valid & self.doc_type_valid & self.country_valid & self.doc_number_valid & self.location_valid
+                & self.bird_date_valid & self.expiration_date_valid & self.nationality_valid & self.nuip_valid)
+
+
+def _empty_batch(with_documents: bool) -> MRZBatch:
+    """
+    MRZBatch of zero rows, the string operations of parse_batch do not accept empty arrays
+    """
+    columns = {}
+    for field in fields(MRZBatch):
+        if field.name == 'documents':
+            continue
+        if field.name.endswith('_valid'):
+            columns[field.name] = np.zeros(0, dtype=bool)
+        elif field.name.endswith('_date'):
+            columns[field.name] = np.zeros(0, dtype='M8[D]')
+        elif field.name.endswith('_name'):
+            columns[field.name] = np.zeros(0, dtype=object)
+        else:
+            columns[field.name] = np.zeros(0, dtype=f'U{MRZ_LINE_LENGTH}')
+    return MRZBatch(documents=[] if with_documents else None, **columns)
+
+
+def to_char_matrix(lines: Union[np.ndarray, Iterable[str]]) -> np.ndarray:
+    """
+    Normalize the input to a (N, 3, 30) uint8 matrix
+    :param lines: a (N, 3) array of 30-char lines (str or bytes), a (N, 3, 30) uint8 array
+        or an iterable of MRZ strings with the three lines separated by new lines
+    :return: np.ndarray of bytes, short lines are right padded with zeros
+    """
+    if isinstance(lines, np.ndarray) and lines.dtype == np.uint8:
+        if lines.ndim != 3 or lines.shape[1:] != (3, MRZ_LINE_LENGTH):
+            raise Exception('Invalid MRZ batch: expected a (N, 3, 30) byte matrix')
+        return lines
+    if not isinstance(lines, np.ndarray):
+        rows = []
+        for mrz in lines:
+            row = mrz.strip().replace(' ', '').split('\n')
+            if len(row) != 3:
+                raise Exception('Invalid MRZ format: Invalid number of lines')
+            rows.append(row)
+        lines = np.array(rows, dtype=f'U{MRZ_LINE_LENGTH}').reshape(-1, 3)
+    if lines.ndim != 2 or lines.shape[1] != 3:
+        raise Exception('Invalid MRZ batch: expected three lines per row')
+    if lines.dtype.kind == 'U':
+        lines = np.char.encode(lines.astype(f'U{MRZ_LINE_LENGTH}'), 'ascii', 'replace')
+    fixed = lines.astype(f'S{MRZ_LINE_LENGTH}')
+    return np.frombuffer(fixed.tobytes(), dtype=np.uint8).reshape(len(fixed), 3, MRZ_LINE_LENGTH)
+
+
+def compute_check_digits(chars: np.ndarray, strip_leading_zeros: bool = False) -> np.ndarray:
+    """
+    Vectorized CheckDigitCalculator.compute_check_digit
+    :param chars: (N, W) uint8 matrix, one field per row
+    :param strip_leading_zeros: align the weights after the leading zeros like the parser
+        does for the document number
+    :return: (N,) array of check digits as ints
+    """
+    values = _CHAR_VALUES[chars]
+    positions = np.arange(chars.shape[1])
+    if strip_leading_zeros:
+        zeros = np.argmax(chars != ord('0'), axis=1)
+        zeros[(chars == ord('0')).all(axis=1)] = chars.shape[1]
+        weights = _WEIGHTS[(positions[None, :] - zeros[:, None]) % 3]
+    else:
+        weights = _WEIGHTS[positions % 3][None, :]
+    return (values * weights).sum(axis=1) % 10
+
+
+def decode_dates(chars: np.ndarray, is_past: bool, current_year: Optional[int] = None):
+    """
+    Vectorized MRZParser._parse_date without the check digit
+    :param chars: (N, 6) uint8 matrix in YYMMDD format
+    :param is_past: if True, the year is assumed to be in the past, otherwise in the future
+    :param current_year: two digits year used as century pivot, defaults to the shared MRZDateDecoder one
+    :return: (dates, valid) with dates as datetime64[D] and NaT for invalid rows
+    """
+    if current_year is None:
+        current_year = get_date_decoder().current_year
+    digits = chars.astype(np.int64) - ord('0')
+    numeric = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    digits[~numeric] = 0
+    yy = digits[:, 0] * 10 + digits[:, 1]
+    mm = digits[:, 2] * 10 + digits[:, 3]
+    dd = digits[:, 4] * 10 + digits[:, 5]
+    if is_past:
+        year = np.where(yy > current_year, 1900 + yy, 2000 + yy)
+    else:
+        year = 2000 + yy
+    valid = numeric & (mm >= 1) & (mm <= 12) & (dd >= 1)
+    months = np.where(valid, (year - 1970) * 12 + mm - 1, 0).astype('M8[M]')
+    dates = months.astype('M8[D]') + np.where(valid, dd - 1, 0)
+    valid &= dates.astype('M8[M]') == months
+    dates[~valid] = np.datetime64('NaT')
+    return dates, valid
+
+
+def _decode_field(chars: np.ndarray) -> np.ndarray:
+    width = chars.shape[1]
+    return np.frombuffer(np.ascontiguousarray(chars).tobytes(), dtype=f'S{width}').astype(f'U{width}')
+
+
+def _countries(raw_codes: np.ndarray):
+    """
+    :return: canonical alpha-3 codes (the raw code when unknown), uppercased names ('' when unknown)
+        and whether the code is known
+    """
+    table = get_country_table()
+    unique, inverse = np.unique(raw_codes, return_inverse=True)
+    codes = []
+    names = []
+    known = []
+    for raw_code in unique:
+        country = table.get(str(raw_code))
+        codes.append(country.code if country is not None else str(raw_code))
+        names.append(country.name if country is not None else '')
+        known.append(country is not None)
+    return (np.array(codes, dtype=raw_codes.dtype)[inverse], np.array(names, dtype=object)[inverse],
+            np.array(known, dtype=bool)[inverse])
+
+
+def _is_number(chars: np.ndarray) -> np.ndarray:
+    """
+    Vectorized str.lstrip('0').isnumeric(): only digits and not all zeros
+    """
+    return (((chars >= ord('0')) & (chars <= ord('9'))).all(axis=1)) & (chars != ord('0')).any(axis=1)
+
+
+def parse_batch(lines: Union[np.ndarray, Iterable[str]], with_documents: bool = False,
+                mrz_parser=None) -> MRZBatch:
+    """
+    Parse many MRZ triplets at once using array operations instead of a loop per character
+    :param lines: see to_char_matrix
+    :param with_documents: also build a Document per row with the scalar parser
+    :param mrz_parser: parser used for the per row documents, defaults to ColombianMRZParser
+    :return: MRZBatch
+    """
+    chars = to_char_matrix(lines)
+    if len(chars) == 0:
+        return _empty_batch(with_documents)
+    l1 = chars[:, 0, :]
+    l2 = chars[:, 1, :]
+    l3 = chars[:, 2, :]
+
+    doc_number_chars = l1[:, 5:14]
+    doc_number_valid = compute_check_digits(doc_number_chars, strip_leading_zeros=True) + ord('0') == l1[:, 14]
+    doc_number_valid &= _is_number(doc_number_chars)
+
+    bird_date, bird_date_valid = decode_dates(l2[:, 0:6], True)
+    bird_date_valid &= compute_check_digits(l2[:, 0:6]) + ord('0') == l2[:, 6]
+    bird_date[~bird_date_valid] = np.datetime64('NaT')
+
+    expiration_date, expiration_date_valid = decode_dates(l2[:, 8:14], False)
+    expiration_date_valid &= compute_check_digits(l2[:, 8:14]) + ord('0') == l2[:, 14]
+    expiration_date[~expiration_date_valid] = np.datetime64('NaT')
+
+    composite_chars = np.concatenate([l1[:, 5:30], l2[:, 0:7], l2[:, 8:15], l2[:, 18:29]], axis=1)
+    composite_valid = compute_check_digits(composite_chars) + ord('0') == l2[:, 29]
+
+    mun_code = _decode_field(l1[:, 15:17])
+    dep_code = _decode_field(l1[:, 17:20])
+    registry = get_locality_registry()
+    unique_codes, inverse = np.unique(np.char.add(mun_code, dep_code), return_inverse=True)
+    mun_names = []
+    dep_names = []
+    for codes in unique_codes:
+        loc = registry.get(codes[0:2], codes[2:5])
+        mun_names.append(loc.mun_name if loc is not None else '')
+        dep_names.append(loc.dep_name if loc is not None else '')
+    mun_name = np.array(mun_names, dtype=object)[inverse]
+    dep_name = np.array(dep_names, dtype=object)[inverse]
+
+    country_code, country_name, country_valid = _countries(_decode_field(l1[:, 2:5]))
+    nationality_country_code, nationality_country_name, nationality_valid = _countries(
+        _decode_field(l2[:, 15:18])
+    )
+
+    doc_type = _decode_field(l1[:, 0:1])
+    doc_type = np.where(np.isin(doc_type, ['L', 'l', '1', '|']), 'I', np.char.upper(doc_type))
+    nuip_chars = l2[:, 18:28]
+
+    names = np.char.partition(np.char.rstrip(_decode_field(l3), '<'), '<<')
+
+    documents = None
+    if with_documents:
+        if mrz_parser is None:
+            from parser.colombian_mrz_parser import ColombianMRZParser
+            mrz_parser = ColombianMRZParser()
+        documents = []
+        for row in range(len(chars)):
+            mrz = '\n'.join(bytes(line).rstrip(b'\x00').decode('ascii', 'replace') for line in chars[row])
+            documents.append(mrz_parser.parse(mrz))
+
+    return MRZBatch(
+        line_length_valid=(l1 != 0).all(axis=1) & (l2 != 0).all(axis=1),
+        doc_type=doc_type,
+        doc_type_valid=np.isin(doc_type, ['A', 'C', 'I']),
+        country_code=country_code,
+        country_name=country_name,
+        country_valid=country_valid,
+        doc_number=np.char.lstrip(_decode_field(doc_number_chars), '0'),
+        doc_number_valid=doc_number_valid,
+        mun_code=mun_code,
+        mun_name=mun_name,
+        dep_code=dep_code,
+        dep_name=dep_name,
+        location_valid=mun_name != '',
+        bird_date=bird_date,
+        bird_date_valid=bird_date_valid,
+        sex=_decode_field(l2[:, 7:8]),
+        expiration_date=expiration_date,
+        expiration_date_valid=expiration_date_valid,
+        composite_valid=composite_valid,
+        nationality_country_code=nationality_country_code,
+        nationality_country_name=nationality_country_name,
+        nationality_valid=nationality_valid,
+        nuip=np.char.lstrip(_decode_field(nuip_chars), '0'),
+        nuip_valid=_is_number(nuip_chars),
+        last_names=np.char.replace(names[:, 0], '<', ' '),
+        first_names=np.char.replace(names[:, 2], '<', ' '),
+        documents=documents,
+    )
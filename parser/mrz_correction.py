@@ -0,0 +1,226 @@
+import itertools
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+from domain.model import MRZCorrection
+from parser.locality_registry import LocalityRegistry, get_locality_registry
+from parser.mrz_dates import MRZDateDecoder, get_date_decoder
+from parser.mrz_parser import CheckDigitCalculator
+
+# Letters (and noise) OCR reads in place of a digit, only applied to numeric fields
+_LETTER_TO_DIGIT = {
+    'O': '0', 'Q': '0', 'D': '0', 'U': '0',
+    'I': '1', 'L': '1', 'J': '1', '|': '1',
+    'Z': '2', 'A': '4', 'S': '5', 'G': '6', 'T': '7', 'B': '8',
+}
+# Digits OCR mistakes for one another, tried when a field still fails validation
+_DIGIT_CONFUSIONS = {
+    '0': '86', '1': '7', '2': '7', '3': '8', '5': '6', '6': '058', '7': '1', '8': '0369', '9': '8',
+}
+_COERCION_COST = 1
+_CONFUSION_COST = 2
+
+
+class _Field(NamedTuple):
+    line: int
+    start: int
+    end: int
+
+
+# TD1 numeric fields, check digits included
+_DOC_NUMBER = _Field(0, 5, 15)
+_LOCALITY = _Field(0, 15, 20)
+_BIRD_DATE = _Field(1, 0, 7)
+_EXPIRATION_DATE = _Field(1, 8, 15)
+_NUIP = _Field(1, 18, 28)
+_COMPOSITE = _Field(1, 29, 30)
+
+
+class _Candidate(NamedTuple):
+    cost: int
+    text: str
+    changes: Tuple[Tuple[int, str, str], ...]
+
+
+class _Budget:
+
+    def __init__(self, evaluations: int):
+        self.left = evaluations
+
+    def spend(self) -> bool:
+        if self.left <= 0:
+            return False
+        self.left -= 1
+        return True
+
+
+class MRZCorrector:
+    """
+    Repairs OCR misreadings in the numeric fields of a TD1 MRZ before it is parsed.
+    Letters in numeric fields are mapped to the digit they are usually mistaken for (O -> 0, I -> 1, B -> 8...),
+    then fields that still fail validation get up to max_edits digit confusions (8 <-> 3, 1 <-> 7...).
+    Candidates are kept only if they pass the field check digit (doc number, dates) or exist in the
+    locality table, and digit confusions are only applied when the combination of candidates also passes
+    the composite check digit, the cheapest one wins and ties are not corrected.
+    Without a passing composite, letters are only replaced in the fields whose own check digit then passes,
+    the others (locality, nuip) are returned as suggestions (applied=False) and left as read.
+    Every check digit evaluation counts against budget, when it runs out the search stops
+    """
+
+    def __init__(self, max_edits: int = 2, budget: int = 2000, max_candidates: int = 4,
+                 date_decoder: Optional[MRZDateDecoder] = None,
+                 locality_registry: Optional[LocalityRegistry] = None):
+        self._max_edits = max_edits
+        self._budget = budget
+        self._max_candidates = max_candidates
+        self._date_decoder = date_decoder
+        self._locality_registry = locality_registry
+
+    def correct(self, l1: str, l2: str) -> Tuple[str, str, Tuple[MRZCorrection, ...]]:
+        """
+        :param l1: first MRZ line, e.g. "ICCOL000000O12305001<<<<<<<<<<"
+        :param l2: second MRZ line
+        :return: the corrected lines and the corrections, applied or only suggested,
+            lines shorter than 30 chars are returned as is
+        """
+        if len(l1) < 30 or len(l2) < 30:
+            return l1, l2, ()
+        budget = _Budget(self._budget)
+        dates = self._date_decoder or get_date_decoder()
+        registry = self._locality_registry or get_locality_registry()
+        lines = (l1, l2)
+        check_digits = {
+            _DOC_NUMBER: _is_valid_doc_number,
+            _BIRD_DATE: lambda text: _is_valid_date(dates, text, True),
+            _EXPIRATION_DATE: lambda text: _is_valid_date(dates, text, False),
+        }
+        validated = (
+            (_DOC_NUMBER, check_digits[_DOC_NUMBER]),
+            (_LOCALITY, lambda text: text.isdecimal() and registry.get(text[0:2], text[2:5]) is not None),
+            (_BIRD_DATE, check_digits[_BIRD_DATE]),
+            (_EXPIRATION_DATE, check_digits[_EXPIRATION_DATE]),
+        )
+        fields: List[_Field] = []
+        candidates: List[List[_Candidate]] = []
+        for field, validate in validated:
+            fields.append(field)
+            candidates.append(self._field_candidates(lines[field.line][field.start:field.end], validate, budget))
+        for field in (_NUIP, _COMPOSITE):
+            fields.append(field)
+            candidates.append([_coerce(lines[field.line][field.start:field.end])])
+
+        chosen = self._resolve_with_composite(lines, fields, candidates, budget)
+        if chosen is not None:
+            # The composite check digit covers every field, it confirms the whole combination
+            return _apply(lines, fields, chosen, [True] * len(fields))
+        # Digit confusions are only trusted once the composite check digit confirms them, letters only where
+        # the field check digit does
+        chosen = [_coerce(lines[field.line][field.start:field.end]) for field in fields]
+        applied = [field in check_digits and check_digits[field](candidate.text)
+                   for field, candidate in zip(fields, chosen)]
+        return _apply(lines, fields, chosen, applied)
+
+    def _field_candidates(self, text: str, validate: Callable[[str], bool], budget: _Budget) -> List[_Candidate]:
+        """
+        :return: the cheapest candidates passing validate, or only the coerced text when none does
+        """
+        base = _coerce(text)
+        if not budget.spend() or validate(base.text):
+            return [base]
+        editable = [i for i, char in enumerate(base.text) if char in _DIGIT_CONFUSIONS]
+        found: List[_Candidate] = []
+        for edits in range(1, self._max_edits + 1):
+            for positions in itertools.combinations(editable, edits):
+                for replacements in itertools.product(*(_DIGIT_CONFUSIONS[base.text[i]] for i in positions)):
+                    if not budget.spend():
+                        return _cheapest(found, self._max_candidates) or [base]
+                    candidate = _edit(base, positions, replacements)
+                    if validate(candidate.text):
+                        found.append(candidate)
+            if found:
+                break
+        return _cheapest(found, self._max_candidates) or [base]
+
+    def _resolve_with_composite(self, lines: Tuple[str, str], fields: Sequence[_Field],
+                                candidates: Sequence[List[_Candidate]], budget: _Budget) -> Optional[List[_Candidate]]:
+        """
+        :return: the cheapest combination of field candidates passing the composite check digit, None if no
+            combination does or if the cheapest ones tie
+        """
+        best: Optional[Tuple[int, List[_Candidate]]] = None
+        tied = False
+        for combination in itertools.product(*candidates):
+            if not budget.spend():
+                break
+            l1, l2 = _apply_text(lines, fields, combination)
+            if CheckDigitCalculator.compute_composite_check_digit(l1, l2) != l2[29]:
+                continue
+            cost = sum(candidate.cost for candidate in combination)
+            if best is None or cost < best[0]:
+                best = (cost, list(combination))
+                tied = False
+            elif cost == best[0]:
+                tied = True
+        if best is None or tied:
+            return None
+        return best[1]
+
+
+def _is_valid_doc_number(text: str) -> bool:
+    doc_number = text[0:9]
+    return doc_number.isdecimal() and CheckDigitCalculator.compute_check_digit(doc_number.lstrip('0')) == text[9]
+
+
+def _is_valid_date(dates: MRZDateDecoder, text: str, is_past: bool) -> bool:
+    decoded = dates.decode(text[0:6], is_past)
+    return decoded.error is None and decoded.check_digit == text[6]
+
+
+def _coerce(text: str) -> _Candidate:
+    changes = tuple((i, char, _LETTER_TO_DIGIT[char]) for i, char in enumerate(text) if char in _LETTER_TO_DIGIT)
+    if not changes:
+        return _Candidate(0, text, ())
+    chars = list(text)
+    for i, _, replacement in changes:
+        chars[i] = replacement
+    return _Candidate(_COERCION_COST * len(changes), ''.join(chars), changes)
+
+
+def _edit(base: _Candidate, positions: Sequence[int], replacements: Sequence[str]) -> _Candidate:
+    chars = list(base.text)
+    changes = dict((i, (original, replacement)) for i, original, replacement in base.changes)
+    for i, replacement in zip(positions, replacements):
+        original = changes[i][0] if i in changes else chars[i]
+        chars[i] = replacement
+        changes[i] = (original, replacement)
+    return _Candidate(
+        base.cost + _CONFUSION_COST * len(positions),
+        ''.join(chars),
+        tuple((i, original, replacement) for i, (original, replacement) in sorted(changes.items())),
+    )
+
+
+def _cheapest(candidates: List[_Candidate], limit: int) -> List[_Candidate]:
+    return sorted(candidates, key=lambda candidate: candidate.cost)[:limit]
+
+
+def _apply_text(lines: Tuple[str, str], fields: Sequence[_Field], chosen: Sequence[_Candidate]) -> Tuple[str, str]:
+    chars = [list(lines[0]), list(lines[1])]
+    for field, candidate in zip(fields, chosen):
+        chars[field.line][field.start:field.end] = candidate.text
+    return ''.join(chars[0]), ''.join(chars[1])
+
+
+def _apply(lines: Tuple[str, str], fields: Sequence[_Field], chosen: Sequence[_Candidate],
+           applied: Sequence[bool]) -> Tuple[str, str, Tuple[MRZCorrection, ...]]:
+    """
+    :param applied: per field, False only reports its changes as suggestions
+    """
+    applied_fields = [(field, candidate) for field, candidate, apply in zip(fields, chosen, applied) if apply]
+    l1, l2 = _apply_text(lines, [field for field, _ in applied_fields], [candidate for _, candidate in applied_fields])
+    corrections = tuple(
+        MRZCorrection(line=field.line, position=field.start + i, original=original, replacement=replacement,
+                      applied=apply)
+        for field, candidate, apply in zip(fields, chosen, applied)
+        for i, original, replacement in candidate.changes
+    )
+    return l1, l2, corrections
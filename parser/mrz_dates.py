@@ -0,0 +1,89 @@
+import calendar
+import datetime
+import functools
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from domain.model import ErrorCode
+from parser.mrz_parser import CheckDigitCalculator
+
+
+class DecodedDate(NamedTuple):
+    date: Optional[datetime.date]
+    error: Optional[ErrorCode]
+    check_digit: str
+
+
+class MRZDateDecoder:
+    """
+    Turns MRZ YYMMDD fields into dates.
+    The century pivot is read from the clock once, when first needed, and valid dates are memoized
+    together with their check digit: there are only ~36k valid YYMMDD values, so documents sharing
+    a birth or expiration date cost a single dict hit. Invalid (OCR damaged) fields are decoded every
+    time, so whatever the input the cache never grows past the valid dates
+    """
+
+    def __init__(self, clock: Callable[[], datetime.date] = datetime.date.today):
+        """
+        :param clock: returns today, the pivot stays fixed for the lifetime of the decoder
+        """
+        self._clock = clock
+        self._current_year: Optional[int] = None
+        self._cache: Dict[Tuple[str, bool], DecodedDate] = {}
+
+    @property
+    def current_year(self) -> int:
+        """
+        Two digits year used as century pivot for past dates, e.g. 24 for 2024
+        """
+        if self._current_year is None:
+            self._current_year = self._clock().year % 100
+        return self._current_year
+
+    def decode(self, date_str: str, is_past: bool) -> DecodedDate:
+        """
+        :param date_str: i.e. "900101" for January 1st, 1990
+        :param is_past: if True, the year is assumed to be in the past, otherwise in the future
+        :return: DecodedDate with either the date or the ErrorCode, and the expected check digit
+        """
+        key = (date_str, is_past)
+        decoded = self._cache.get(key)
+        if decoded is not None:
+            return decoded
+        decoded = self._decode(date_str, is_past)
+        if decoded.error is None and len(date_str) == 6 and date_str.isascii():
+            self._cache[key] = decoded
+        return decoded
+
+    def _decode(self, date_str: str, is_past: bool) -> DecodedDate:
+        check_digit = CheckDigitCalculator.compute_check_digit(date_str[0:6])
+        year_str = date_str[0:2]
+        if not year_str.isdecimal():
+            return DecodedDate(None, ErrorCode.DATE_YEAR_NOT_NUMERIC, check_digit)
+        year = int(year_str)
+        if is_past and year > self.current_year:
+            year += 1900
+        else:
+            year += 2000
+        month_str = date_str[2:4]
+        if not month_str.isdecimal():
+            return DecodedDate(None, ErrorCode.DATE_MONTH_NOT_NUMERIC, check_digit)
+        day_str = date_str[4:6]
+        if not day_str.isdecimal():
+            return DecodedDate(None, ErrorCode.DATE_DAY_NOT_NUMERIC, check_digit)
+        month = int(month_str)
+        day = int(day_str)
+        # Range checked up front so datetime.date never has to raise ValueError
+        if not 1 <= month <= 12 or not 1 <= day <= calendar.monthrange(year, month)[1]:
+            return DecodedDate(None, ErrorCode.INVALID_DATE, check_digit)
+        return DecodedDate(datetime.date(year, month, day), None, check_digit)
+
+    def cache_size(self) -> int:
+        return len(self._cache)
+
+
+@functools.lru_cache(maxsize=None)
+def get_date_decoder() -> MRZDateDecoder:
+    """
+    Decoder shared by the whole process
+    """
+    return MRZDateDecoder()
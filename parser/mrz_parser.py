@@ -1,28 +1,58 @@
 import datetime
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Optional, Tuple
 
-from domain.model import Document
+from domain.model import Document, ErrorCode, MRZError
+
+if TYPE_CHECKING:
+    from parser.mrz_dates import MRZDateDecoder
+
+
+def _build_weighted_table(weight: int) -> bytes:
+    """
+    256-entry translation table mapping every byte to (char value * weight) % 10.
+    Digits are worth their value, A-Z are worth 10-35 and any other char ('<' included) is worth 0
+    """
+    table = bytearray(256)
+    for value, char in enumerate('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'):
+        table[ord(char)] = (value * weight) % 10
+    return bytes(table)
+
+
+_WEIGHT_7_TABLE = _build_weighted_table(7)
+_WEIGHT_3_TABLE = _build_weighted_table(3)
+_WEIGHT_1_TABLE = _build_weighted_table(1)
+_DIGITS = '0123456789'
 
 
 class CheckDigitCalculator:
     @staticmethod
     def compute_check_digit(data: str) -> str:
         """
-        Compute the validation digit for the given data
+        Compute the validation digit for the given data.
+        Only the ICAO 9303 charset is weighted: 0-9 and A-Z. '<' and any other char, lowercase or non ASCII
+        (e.g. an OCR read 'Ñ'), is worth 0 like the filler, so a damaged field still gets a digit to compare
         :param data: e.g. "900101"
         :return: e.g. "1"
         """
-        weights = [7, 3, 1]
-        check_sum = 0
-        for i in range(len(data)):
-            char = data[i]
-            if char.isdigit():
-                check_sum += int(char) * weights[i % 3]
-            elif char.isupper():
-                check_sum += (ord(char) - 55) * weights[i % 3]
-            elif char == '<':
-                check_sum += 0
-        return str(check_sum % 10)
+        # The weights repeat every 3 chars, so each stride of the data is translated with its
+        # weight already folded in and summed in C instead of looping per character.
+        # Chars beyond latin-1 become '?', one byte each so the strides stay aligned, and are worth 0
+        raw = data.encode('latin-1', 'replace')
+        check_sum = (sum(raw[0::3].translate(_WEIGHT_7_TABLE))
+                     + sum(raw[1::3].translate(_WEIGHT_3_TABLE))
+                     + sum(raw[2::3].translate(_WEIGHT_1_TABLE)))
+        return _DIGITS[check_sum % 10]
+
+    @classmethod
+    def compute_composite_check_digit(cls, l1: str, l2: str) -> str:
+        """
+        Compute the TD1 composite check digit (last char of the second line)
+        :param l1: first MRZ line, e.g. "ICCOL000000012305001<<<<<<<<<<"
+        :param l2: second MRZ line, e.g. "0403151F3203190C0L1234567890<0"
+        :return: e.g. "5"
+        """
+        return cls.compute_check_digit(l1[5:30] + l2[0:7] + l2[8:15] + l2[18:29])
 
 
 class MRZParser(ABC):
@@ -31,41 +61,37 @@ class MRZParser(ABC):
     def parse(self, mrz: str) -> Document:
         pass
 
+    # Set by a subclass for its own decoder (e.g. with a fixed clock), the process wide one is used otherwise
+    date_decoder: Optional['MRZDateDecoder'] = None
+
+    @classmethod
+    def _get_date_decoder(cls) -> 'MRZDateDecoder':
+        if cls.date_decoder is not None:
+            return cls.date_decoder
+        # Imported here, mrz_dates needs CheckDigitCalculator from this module
+        from parser.mrz_dates import get_date_decoder
+        return get_date_decoder()
+
     @classmethod
-    def _parse_date(cls, date_str: str, date_check_digit: str, is_past: bool, field_name: str) -> datetime.date:
+    def _parse_date(cls, date_str: str, date_check_digit: str, is_past: bool,
+                    field_name: str) -> Tuple[Optional[datetime.date], Optional[MRZError]]:
         """
+        Never raises: OCR noise makes invalid dates common, so failures are returned instead
         :param date_str: i.e. "900101" for January 1st, 1990
         :param date_check_digit: i.e. "1"
         :param is_past: if True, the year is assumed to be in the past, otherwise in the future
         :param field_name: i.e. "bird_date"
-        :return: datetime.date
+        :return: (date, None) or (None, MRZError)
         """
-        year_str = date_str[0:2]
-        if not year_str.isnumeric():
-            raise Exception(f'Invalid MRZ format: Invalid {field_name} year is not numeric')
-        current_year = int(str(datetime.datetime.now().year)[2:4])
-        year = int(year_str)
-        if is_past:
-            if year > current_year:
-                year = 1900 + year
-            else:
-                year = 2000 + year
-        else:
-            year = 2000 + year
-        date_month_str = date_str[2:4]
-        if not date_month_str.isnumeric():
-            raise Exception(f'Invalid MRZ format: Invalid {field_name} month is not numeric')
-        date_day_str = date_str[4:6]
-        if not date_day_str.isnumeric():
-            raise Exception(f'Invalid MRZ format: Invalid {field_name} day is not numeric')
-        date = datetime.date(year, int(date_month_str), int(date_day_str))
-        if not date_check_digit.isnumeric():
-            raise Exception(f'Invalid MRZ format: Invalid {field_name} check digit is not numeric')
-        calculated_check_digit = cls._calculate_check_digit(date_str[0:2] + date_month_str + date_day_str)
+        date, error, calculated_check_digit = cls._get_date_decoder().decode(date_str, is_past)
+        if error is not None:
+            return None, MRZError(error, (field_name,))
+        if not date_check_digit.isdecimal():
+            return None, MRZError(ErrorCode.DATE_CHECK_DIGIT_NOT_NUMERIC, (field_name,))
         if date_check_digit != calculated_check_digit:
-            raise Exception(f'Invalid MRZ format: Invalid {field_name} check digit {date_check_digit} '
-                            f'expected {calculated_check_digit}')
-        return date
+            return None, MRZError(ErrorCode.DATE_CHECK_DIGIT_MISMATCH,
+                                  (field_name, date_check_digit, calculated_check_digit))
+        return date, None
 
     @staticmethod
     def _calculate_check_digit(data) -> str:
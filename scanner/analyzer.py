@@ -1,10 +1,96 @@
+import asyncio
+import threading
 from abc import ABC, abstractmethod
+from typing import Awaitable, BinaryIO, Callable, Optional, Union
 
 from domain.model import Document
 
+# Image content accepted by the analyzers: raw bytes, a zero copy view over a buffer or an open binary file
+DocumentFile = Union[bytes, bytearray, memoryview, BinaryIO]
+
+
+def read_document(file: DocumentFile) -> Union[bytes, memoryview]:
+    """
+    Get the content of a DocumentFile as a buffer, copying only when the source is a stream
+    :param file: bytes, bytearray, memoryview or a binary file-like object
+    :return: bytes or memoryview
+    """
+    if isinstance(file, bytes):
+        return file
+    if isinstance(file, (bytearray, memoryview)):
+        return memoryview(file).cast('B')
+    getbuffer = getattr(file, 'getbuffer', None)
+    if getbuffer is not None:
+        return getbuffer()
+    return file.read()
+
 
 class DocumentAnalyzer(ABC):
 
     @abstractmethod
-    def analyze_document_id(self, file: bytes) -> Document:
+    def analyze_document_id(self, file: DocumentFile) -> Document:
+        pass
+
+
+class LazyDocumentAnalyzer(DocumentAnalyzer):
+    """
+    Builds the wrapped analyzer (and its clients) on first use instead of at construction time
+    """
+
+    def __init__(self, factory: Callable[[], DocumentAnalyzer]):
+        self._factory = factory
+        self._analyzer: Optional[DocumentAnalyzer] = None
+        self._lock = threading.Lock()
+
+    @property
+    def analyzer(self) -> DocumentAnalyzer:
+        if self._analyzer is None:
+            with self._lock:
+                if self._analyzer is None:
+                    self._analyzer = self._factory()
+        return self._analyzer
+
+    def analyze_document_id(self, file: DocumentFile) -> Document:
+        return self.analyzer.analyze_document_id(file)
+
+
+class AsyncDocumentAnalyzer(ABC):
+    """
+    Counterpart of DocumentAnalyzer for analyzers that do their I/O on the event loop
+    """
+
+    @abstractmethod
+    async def analyze_document_id(self, file: DocumentFile) -> Document:
         pass
+
+    async def aclose(self):
+        """
+        Release what the analyzer keeps open (e.g. its clients), called once when the app shuts down
+        """
+
+
+class LazyAsyncDocumentAnalyzer(AsyncDocumentAnalyzer):
+    """
+    LazyDocumentAnalyzer for a factory that is a coroutine, async clients have to be opened on the event loop
+    that uses them
+    """
+
+    def __init__(self, factory: Callable[[], Awaitable[AsyncDocumentAnalyzer]]):
+        self._factory = factory
+        self._analyzer: Optional[AsyncDocumentAnalyzer] = None
+        self._lock = asyncio.Lock()
+
+    async def get_analyzer(self) -> AsyncDocumentAnalyzer:
+        if self._analyzer is None:
+            async with self._lock:
+                if self._analyzer is None:
+                    self._analyzer = await self._factory()
+        return self._analyzer
+
+    async def analyze_document_id(self, file: DocumentFile) -> Document:
+        analyzer = await self.get_analyzer()
+        return await analyzer.analyze_document_id(file)
+
+    async def aclose(self):
+        if self._analyzer is not None:
+            await self._analyzer.aclose()
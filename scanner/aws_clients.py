@@ -0,0 +1,102 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+
+@dataclass()
+class AWSClientConfig:
+    """
+    Connection settings shared by every boto3 client of the process.
+    max_pool_connections should be at least the number of analyses running at the same time,
+    otherwise urllib3 drops and re-opens connections (and their TLS handshakes) under load
+    """
+    max_pool_connections: int = 50
+    retry_mode: str = 'adaptive'
+    max_attempts: int = 5
+    connect_timeout: float = 2.0
+    read_timeout: float = 30.0
+    tcp_keepalive: bool = True
+
+    @classmethod
+    def from_env(cls) -> 'AWSClientConfig':
+        default = cls()
+        return cls(
+            max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', default.max_pool_connections)),
+            retry_mode=os.environ.get('AWS_RETRY_MODE', default.retry_mode),
+            max_attempts=int(os.environ.get('AWS_MAX_ATTEMPTS', default.max_attempts)),
+            connect_timeout=float(os.environ.get('AWS_CONNECT_TIMEOUT', default.connect_timeout)),
+            read_timeout=float(os.environ.get('AWS_READ_TIMEOUT', default.read_timeout)),
+            tcp_keepalive=os.environ.get('AWS_TCP_KEEPALIVE', str(default.tcp_keepalive)).lower() in ('1', 'true',
+                                                                                                     'yes'),
+        )
+
+    def to_botocore_config(self):
+        from botocore.config import Config
+        return Config(
+            max_pool_connections=self.max_pool_connections,
+            retries={'mode': self.retry_mode, 'max_attempts': self.max_attempts},
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            tcp_keepalive=self.tcp_keepalive,
+        )
+
+    def to_aio_config(self):
+        from aiobotocore.config import AioConfig
+        return AioConfig(
+            max_pool_connections=self.max_pool_connections,
+            retries={'mode': self.retry_mode, 'max_attempts': self.max_attempts},
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            tcp_keepalive=self.tcp_keepalive,
+        )
+
+
+class AWSClientProvider:
+    """
+    Hands out one boto3 client per (service, region), built from a single session with AWSClientConfig.
+    boto3 clients are thread safe but sessions are not, so clients are created under a lock and then shared
+    """
+
+    def __init__(self, config: Optional[AWSClientConfig] = None, session=None):
+        self._config = config or AWSClientConfig()
+        self._session = session
+        self._clients: Dict[Tuple[str, Optional[str]], object] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def config(self) -> AWSClientConfig:
+        return self._config
+
+    def client(self, service_name: str, region_name: Optional[str] = None):
+        key = (service_name, region_name)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if self._session is None:
+                    import boto3
+                    self._session = boto3.Session()
+                client = self._session.client(
+                    service_name, region_name=region_name, config=self._config.to_botocore_config()
+                )
+                self._clients[key] = client
+        return client
+
+
+async def open_aio_client(service_name: str, region_name: Optional[str] = None,
+                          config: Optional[AWSClientConfig] = None, session=None):
+    """
+    Open an aiobotocore client (aiobotocore is installed apart) on the running event loop.
+    The client is meant to live as long as the app, close it with its close() coroutine
+    :param session: aiobotocore session, a new one by default
+    """
+    if session is None:
+        from aiobotocore.session import get_session
+        session = get_session()
+    config = config or AWSClientConfig()
+    client = session.create_client(service_name, region_name=region_name, config=config.to_aio_config())
+    # Entered by hand instead of with "async with", the client outlives this call
+    return await client.__aenter__()
@@ -0,0 +1,339 @@
+import os
+import tarfile
+import zipfile
+from abc import ABC, abstractmethod
+from concurrent.futures import (ALL_COMPLETED, FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from domain import serializer
+from scanner.analyzer import DocumentAnalyzer
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.pdf')
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+# (name, content) of one document to analyze
+BulkItem = Tuple[str, bytes]
+
+
+def _is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_documents(path: str, skip: Optional[Callable[[str], bool]] = None) -> Iterator[BulkItem]:
+    """
+    Read the images of a directory (recursively), a zip or a tar archive one at a time
+    :param path: directory, .zip or .tar(.gz|.bz2|.xz) file
+    :param skip: names for which it returns True are not read, e.g. Checkpoint.is_done
+    :return: (name, bytes) pairs, names are relative to path
+    """
+    skip = skip or (lambda name: False)
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                full_path = os.path.join(root, file_name)
+                name = os.path.relpath(full_path, path)
+                if _is_image(name) and not skip(name):
+                    with open(full_path, 'rb') as f:
+                        yield name, f.read()
+    elif path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image(info.filename) and not skip(info.filename):
+                    yield info.filename, archive.read(info)
+    elif path.lower().endswith(TAR_EXTENSIONS):
+        # Stream mode: members are read in order and never indexed, whatever the size of the archive
+        with tarfile.open(path, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile() and _is_image(member.name) and not skip(member.name):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise Exception(f"Unsupported input {path}, expected a directory, a zip or a tar file")
+
+
+class Checkpoint:
+    """
+    Append only list of finished names with their status, a resumed run skips them.
+    Names are recorded once their result is durable in the output, results the output holds but the
+    checkpoint missed (a crash in between) are recovered from the output with recover
+    """
+
+    def __init__(self, path: str, retry_failed: bool = False):
+        """
+        :param retry_failed: also analyze again the names whose last result was an error
+        """
+        self._retry_failed = retry_failed
+        self._done: Set[str] = set()
+        # Last recorded status of every name, done or not
+        self._statuses: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        continue
+                    status, _, name = line.rstrip('\n').partition('\t')
+                    self._mark(name, int(status) if status.isdigit() else 0)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def is_done(self, name: str) -> bool:
+        return name in self._done
+
+    def _mark(self, name: str, status: int):
+        self._statuses[name] = status
+        if status == 200 or not self._retry_failed:
+            self._done.add(name)
+        else:
+            self._done.discard(name)
+
+    def _append(self, records: List[Tuple[str, int]]):
+        if not records:
+            return
+        self._file.write(''.join(f'{status}\t{name}\n' for name, status in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def add(self, records: Iterable[Tuple[str, int]]):
+        """
+        :param records: (name, status) pairs, finished in this run so done whatever their status
+        """
+        records = list(records)
+        self._append(records)
+        for name, status in records:
+            self._statuses[name] = status
+            self._done.add(name)
+
+    def recover(self, records: Iterable[Tuple[str, int]]):
+        """
+        Record the results an output already holds but that were never checkpointed
+        :param records: (name, status) pairs in output order, see ResultWriter.recorded
+        """
+        latest: Dict[str, int] = {}
+        for name, status in records:
+            latest[name] = status
+        missing = [(name, status) for name, status in latest.items() if self._statuses.get(name) != status]
+        self._append(missing)
+        for name, status in missing:
+            self._mark(name, status)
+
+    def close(self):
+        self._file.close()
+
+
+class ResultWriter(ABC):
+
+    @abstractmethod
+    def write(self, record: dict) -> bool:
+        """
+        :return: True when every record written so far is durable and can be checkpointed
+        """
+        pass
+
+    def recorded(self) -> Iterator[Tuple[str, int]]:
+        """
+        (filename, status) of the records a previous run left in the output, in the order they were written
+        """
+        return iter(())
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+class JSONLResultWriter(ResultWriter):
+    """
+    One JSON document per line, appended so a resumed run continues the same file
+    """
+
+    def __init__(self, path: str, sync_every: int = 100):
+        """
+        :param sync_every: records written between two fsyncs, only synced records are reported durable
+        """
+        self._file = open(path, 'a+b')
+        self._sync_every = sync_every
+        self._unsynced = 0
+        self._truncate_partial_line()
+
+    def _truncate_partial_line(self):
+        """
+        Drop the incomplete last line a crash may have left, reading backwards so big files are not loaded
+        """
+        end = self._file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 64 * 1024)
+            self._file.seek(start)
+            chunk = self._file.read(position - start)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            self._file.truncate(position)
+
+    def recorded(self) -> Iterator[Tuple[str, int]]:
+        # Only complete lines are left once the partial one is truncated, each is a finished result
+        self._file.seek(0)
+        for line in self._file:
+            record = serializer.loads(line)
+            yield record['filename'], record['status']
+
+    def write(self, record: dict) -> bool:
+        self._file.write(serializer.dumps(record) + b'\n')
+        self._unsynced += 1
+        if self._unsynced < self._sync_every:
+            return False
+        self._sync()
+        return True
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        self._sync()
+        self._file.close()
+
+
+class ParquetResultWriter(ResultWriter):
+    """
+    Writes a directory of part files of row_group_size records each, needs pyarrow.
+    The document is stored as a JSON string column, a resumed run starts a new part
+    """
+
+    def __init__(self, directory: str, row_group_size: int = 10_000):
+        import pyarrow
+        import pyarrow.parquet
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self._directory = directory
+        self._row_group_size = row_group_size
+        self._rows: Dict[str, List] = {'filename': [], 'status': [], 'result': []}
+        os.makedirs(directory, exist_ok=True)
+        self._part = len([name for name in os.listdir(directory) if name.endswith('.parquet')])
+
+    def recorded(self) -> Iterator[Tuple[str, int]]:
+        for part in range(self._part):
+            path = os.path.join(self._directory, f'part-{part:05d}.parquet')
+            table = self._parquet.read_table(path, columns=['filename', 'status'])
+            yield from zip(table.column('filename').to_pylist(), table.column('status').to_pylist())
+
+    def write(self, record: dict) -> bool:
+        self._rows['filename'].append(record['filename'])
+        self._rows['status'].append(record['status'])
+        self._rows['result'].append(serializer.dumps(record['result']).decode('utf-8'))
+        if len(self._rows['filename']) < self._row_group_size:
+            return False
+        self._flush()
+        return True
+
+    def _flush(self):
+        if not self._rows['filename']:
+            return
+        table = self._pyarrow.table(self._rows)
+        path = os.path.join(self._directory, f'part-{self._part:05d}.parquet')
+        self._parquet.write_table(table, path)
+        self._part += 1
+        self._rows = {'filename': [], 'status': [], 'result': []}
+
+    def close(self):
+        self._flush()
+
+
+@dataclass()
+class BulkStats:
+    analyzed: int = 0
+    failed: int = 0
+
+
+def analyze_to_record(analyzer: DocumentAnalyzer, name: str, contents: bytes) -> dict:
+    """
+    :return: same shape as the /analyze/batch lines: filename, status (200 or 422) and result
+    """
+    try:
+        document = analyzer.analyze_document_id(contents)
+    except Exception as e:
+        return {"filename": name, "status": 422, "result": str(e)}
+    return {"filename": name, "status": 200, "result": serializer.document_to_dict(document)}
+
+
+_worker_analyzer: Optional[DocumentAnalyzer] = None
+
+
+def _init_worker(analyzer_factory: Callable[[], DocumentAnalyzer]):
+    global _worker_analyzer
+    _worker_analyzer = analyzer_factory()
+
+
+def _analyze_in_worker(name: str, contents: bytes) -> dict:
+    return analyze_to_record(_worker_analyzer, name, contents)
+
+
+def run_bulk(items: Iterable[BulkItem], analyzer_factory: Callable[[], DocumentAnalyzer], writer: ResultWriter,
+             checkpoint: Optional[Checkpoint] = None, use_processes: bool = False, workers: int = 4,
+             max_in_flight: Optional[int] = None,
+             on_record: Optional[Callable[[dict], None]] = None) -> BulkStats:
+    """
+    Analyze items concurrently and write each result as soon as it is ready, in completion order
+    :param analyzer_factory: builds the analyzer, once per worker process or once for all the threads.
+        Must be picklable (a module level function) when use_processes is True
+    :param use_processes: a process pool for CPU bound analyzers (local OCR), threads for I/O bound ones (Textract)
+    :param max_in_flight: documents read but not written yet, bounds memory whatever the input size.
+        Defaults to twice the workers
+    :param on_record: called with every record written, e.g. for progress
+    """
+    if checkpoint is not None:
+        # Before items is consumed, so the recovered names are skipped
+        checkpoint.recover(writer.recorded())
+    max_in_flight = max_in_flight or 2 * workers
+    executor: Executor
+    if use_processes:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(analyzer_factory,))
+        task = _analyze_in_worker
+    else:
+        analyzer = analyzer_factory()
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk')
+
+        def task(name: str, contents: bytes) -> dict:
+            return analyze_to_record(analyzer, name, contents)
+
+    stats = BulkStats()
+    pending: Set[Future] = set()
+    unflushed: List[Tuple[str, int]] = []
+
+    def drain(return_when):
+        nonlocal pending
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            record = future.result()
+            if record["status"] == 200:
+                stats.analyzed += 1
+            else:
+                stats.failed += 1
+            durable = writer.write(record)
+            unflushed.append((record["filename"], record["status"]))
+            if durable and checkpoint is not None:
+                checkpoint.add(unflushed)
+                unflushed.clear()
+            if on_record is not None:
+                on_record(record)
+
+    try:
+        for name, contents in items:
+            pending.add(executor.submit(task, name, contents))
+            if len(pending) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+        if pending:
+            drain(ALL_COMPLETED)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+        if checkpoint is not None:
+            checkpoint.add(unflushed)
+    return stats
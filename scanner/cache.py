@@ -0,0 +1,198 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple, Union
+
+from domain import serializer
+from domain.model import Document
+from scanner.analyzer import AsyncDocumentAnalyzer, DocumentAnalyzer, DocumentFile, read_document
+
+
+def content_key(file: Union[bytes, memoryview]) -> str:
+    """
+    Key used to identify an image by its content
+    :param file: image bytes
+    :return: sha256 hex digest
+    """
+    return hashlib.sha256(file).hexdigest()
+
+
+class ResultCache(ABC):
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Document]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, document: Document):
+        pass
+
+
+class LRUResultCache(ResultCache):
+    """
+    In process cache, entries expire after ttl seconds and the least recently used
+    entry is evicted once max_entries is reached.
+    Every caller gets the same Document instance, which is safe because Documents are frozen
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_entries <= 0:
+            raise ValueError('max_entries must be greater than 0')
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._entries: 'OrderedDict[str, Tuple[float, Document]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Document]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, document = entry
+            if self._ttl is not None and self._clock() - created > self._ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return document
+
+    def set(self, key: str, document: Document):
+        with self._lock:
+            self._entries[key] = (self._clock(), document)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteResultCache(ResultCache):
+    """
+    On disk cache shared by every worker of the host, documents are stored as JSON with domain.serializer,
+    so reading a row can never run code. Rows that do not decode to a Document count as misses
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = 7 * 24 * 3600.0, clock: Callable[[], float] = time.time):
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL NOT NULL, value BLOB NOT NULL)'
+            )
+
+    def get(self, key: str) -> Optional[Document]:
+        with self._lock:
+            row = self._conn.execute('SELECT created, value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            created, value = row
+            if self._ttl is not None and self._clock() - created > self._ttl:
+                with self._conn:
+                    self._conn.execute('DELETE FROM results WHERE key = ?', (key,))
+                return None
+        try:
+            return serializer.document_from_dict(serializer.loads(value))
+        except (ValueError, KeyError, TypeError):
+            # Written by an older version, e.g. pickled, it is replaced on the next set
+            return None
+
+    def set(self, key: str, document: Document):
+        value = serializer.dumps(document)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (key, created, value) VALUES (?, ?, ?)',
+                (key, self._clock(), value),
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+@dataclass()
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class _CacheLookup:
+    """
+    Cache lookup and hit/miss counting shared by CachingDocumentAnalyzer and AsyncCachingDocumentAnalyzer
+    """
+
+    def __init__(self, cache: ResultCache):
+        self._cache = cache
+        self._stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._stats_lock:
+            return CacheStats(hits=self._stats.hits, misses=self._stats.misses)
+
+    def _lookup(self, file: DocumentFile) -> Tuple[Union[bytes, memoryview], str, Optional[Document]]:
+        """
+        :return: the file content, its cache key and the cached document, None on a miss
+        """
+        file = read_document(file)
+        key = content_key(file)
+        document = self._cache.get(key)
+        with self._stats_lock:
+            if document is not None:
+                self._stats.hits += 1
+            else:
+                self._stats.misses += 1
+        return file, key, document
+
+
+class CachingDocumentAnalyzer(_CacheLookup, DocumentAnalyzer):
+    """
+    Serves repeated uploads of the same image from a ResultCache instead of analyzing them again.
+    Only successful results are cached
+    """
+
+    def __init__(self, analyzer: DocumentAnalyzer, cache: ResultCache):
+        super().__init__(cache)
+        self._analyzer = analyzer
+
+    def analyze_document_id(self, file: DocumentFile) -> Document:
+        file, key, document = self._lookup(file)
+        if document is not None:
+            return document
+        document = self._analyzer.analyze_document_id(file)
+        self._cache.set(key, document)
+        return document
+
+
+class AsyncCachingDocumentAnalyzer(_CacheLookup, AsyncDocumentAnalyzer):
+    """
+    CachingDocumentAnalyzer for analyzers running on the event loop. The cache is read and written on the loop,
+    which is fine for LRUResultCache and for a SQLiteResultCache on a local disk
+    """
+
+    def __init__(self, analyzer: AsyncDocumentAnalyzer, cache: ResultCache):
+        super().__init__(cache)
+        self._analyzer = analyzer
+
+    async def analyze_document_id(self, file: DocumentFile) -> Document:
+        file, key, document = self._lookup(file)
+        if document is not None:
+            return document
+        document = await self._analyzer.analyze_document_id(file)
+        self._cache.set(key, document)
+        return document
+
+    async def aclose(self):
+        await self._analyzer.aclose()
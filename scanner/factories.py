@@ -0,0 +1,135 @@
+"""
+Analyzer factories configured from the environment, shared by the API (server.py) and the bulk CLI (bulk.py).
+Importing this module builds nothing, clients and tables are created on first use
+"""
+import functools
+import os
+from typing import Optional, Tuple, Union
+
+from parser.colombian_mrz_parser import ColombianMRZParser
+from scanner.analyzer import AsyncDocumentAnalyzer, DocumentAnalyzer, LazyAsyncDocumentAnalyzer, LazyDocumentAnalyzer
+from scanner.aws_clients import AWSClientConfig, AWSClientProvider, open_aio_client
+from scanner.cache import (AsyncCachingDocumentAnalyzer, CachingDocumentAnalyzer, LRUResultCache, ResultCache,
+                           SQLiteResultCache)
+from scanner.instrumentation import PrometheusStageRecorder, StageRecorder
+from scanner.single_flight import AsyncSingleFlightDocumentAnalyzer, SingleFlightDocumentAnalyzer
+from scanner.textract_analyzer import (AioBotocoreS3Client, AioBotocoreTextractClient,
+                                       AsyncTextractColCedulaMRZAnalyzer, Boto3TextractClient, Boto3S3Client,
+                                       TextractColCedulaMRZAnalyzer)
+
+AnyDocumentAnalyzer = Union[DocumentAnalyzer, AsyncDocumentAnalyzer]
+
+
+def create_analyzer() -> AnyDocumentAnalyzer:
+    """
+    Cheap to call: the backend and its AWS clients are only built on the first analysis
+    """
+    backend = os.environ.get('ANALYZER_BACKEND', 'textract')
+    cache = create_result_cache()
+    if backend == 'textract-async':
+        # Identical uploads arriving together are analyzed once, the cache only helps once a result exists
+        analyzer = AsyncSingleFlightDocumentAnalyzer(LazyAsyncDocumentAnalyzer(create_async_textract_analyzer))
+        return analyzer if cache is None else AsyncCachingDocumentAnalyzer(analyzer, cache)
+    if backend == 'local':
+        analyzer = LazyDocumentAnalyzer(create_local_analyzer)
+    elif backend == 'textract':
+        analyzer = LazyDocumentAnalyzer(create_textract_analyzer)
+    else:
+        raise Exception(f"Unknown ANALYZER_BACKEND {backend}")
+    analyzer = SingleFlightDocumentAnalyzer(analyzer)
+    return analyzer if cache is None else CachingDocumentAnalyzer(analyzer, cache)
+
+
+@functools.lru_cache(maxsize=None)
+def get_stage_recorder() -> StageRecorder:
+    """
+    One recorder per process, its metrics live in the global prometheus registry served on /metrics
+    """
+    if os.environ.get('ANALYZER_METRICS', 'true').lower() in ('0', 'false', 'no'):
+        return StageRecorder()
+    return PrometheusStageRecorder()
+
+
+def create_mrz_parser() -> ColombianMRZParser:
+    if os.environ.get('ANALYZER_OCR_CORRECTION', 'false').lower() not in ('1', 'true', 'yes'):
+        return ColombianMRZParser()
+    from parser.mrz_correction import MRZCorrector
+    return ColombianMRZParser(corrector=MRZCorrector())
+
+
+@functools.lru_cache(maxsize=None)
+def configure_tesseract():
+    """
+    Point pytesseract at TESSERACT_CMD, once per process: it is a module global that pytesseract
+    has no per call option for, analyzers never set it themselves
+    """
+    tesseract_cmd = os.environ.get('TESSERACT_CMD')
+    if tesseract_cmd:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def create_local_analyzer() -> DocumentAnalyzer:
+    from scanner.local_analyzer import LocalMRZAnalyzer
+    configure_tesseract()
+    return LocalMRZAnalyzer(create_mrz_parser(), recorder=get_stage_recorder())
+
+
+def _textract_settings() -> Tuple[str, str]:
+    """
+    :return: bucket name and region
+    """
+    aws_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
+    if not aws_key_id:
+        raise Exception("AWS_ACCESS_KEY_ID not set")
+    bucket_name = os.environ.get('AWS_BUCKET_NAME')
+    if not bucket_name:
+        raise Exception("AWS_BUCKET_NAME not set")
+
+    region_name = os.environ.get('AWS_REGION_NAME')
+    if not region_name:
+        raise Exception("AWS_REGION_NAME not set")
+    return bucket_name, region_name
+
+
+def _create_region_detector():
+    if os.environ.get('ANALYZER_CROP_MRZ', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    from scanner.mrz_region import MRZRegionDetector
+    return MRZRegionDetector()
+
+
+def create_textract_analyzer() -> TextractColCedulaMRZAnalyzer:
+    bucket_name, region_name = _textract_settings()
+    provider = AWSClientProvider(AWSClientConfig.from_env())
+    textract_client = Boto3TextractClient.from_provider(provider, region_name=region_name)
+    s3_client = Boto3S3Client.from_provider(provider)
+    return TextractColCedulaMRZAnalyzer(
+        textract_client, s3_client, bucket_name, create_mrz_parser(), region_detector=_create_region_detector(),
+        recorder=get_stage_recorder(),
+    )
+
+
+async def create_async_textract_analyzer() -> AsyncTextractColCedulaMRZAnalyzer:
+    """
+    Opens aiobotocore clients on the running event loop, they are closed when the app shuts down
+    """
+    bucket_name, region_name = _textract_settings()
+    config = AWSClientConfig.from_env()
+    textract_client = AioBotocoreTextractClient(await open_aio_client('textract', region_name, config))
+    s3_client = AioBotocoreS3Client(await open_aio_client('s3', config=config))
+    return AsyncTextractColCedulaMRZAnalyzer(
+        textract_client, s3_client, bucket_name, create_mrz_parser(), region_detector=_create_region_detector(),
+        recorder=get_stage_recorder(),
+    )
+
+
+def create_result_cache() -> Optional[ResultCache]:
+    ttl = float(os.environ.get('ANALYZER_CACHE_TTL', '3600'))
+    cache_path = os.environ.get('ANALYZER_CACHE_PATH')
+    if cache_path:
+        return SQLiteResultCache(cache_path, ttl=ttl)
+    cache_size = int(os.environ.get('ANALYZER_CACHE_SIZE', '1024'))
+    if cache_size <= 0:
+        return None
+    return LRUResultCache(max_entries=cache_size, ttl=ttl)
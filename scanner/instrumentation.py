@@ -0,0 +1,105 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from domain.model import Document
+
+# Buckets for stage durations in seconds, from in-process parsing to slow Textract calls
+STAGE_SECONDS_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PAYLOAD_BYTES_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 2 * 1024 * 1024, 5 * 1024 * 1024,
+                         10 * 1024 * 1024)
+
+
+class StageSpan:
+    """
+    Handed to the body of StageRecorder.stage, set size when the payload size is only known inside the stage
+    """
+    __slots__ = ('name', 'size')
+
+    def __init__(self, name: str, size: Optional[int] = None):
+        self.name = name
+        self.size = size
+
+
+class StageRecorder:
+    """
+    Instrumentation surface of the analyzers, every step of an analysis runs inside stage(...).
+    This base class records nothing, subclasses override the record_* hooks
+    """
+
+    @contextmanager
+    def stage(self, name: str, size: Optional[int] = None) -> Iterator[StageSpan]:
+        """
+        Time the body and record it under name, an exception escaping the body is also recorded
+        :param name: e.g. "textract"
+        :param size: payload size in bytes, if known up front
+        """
+        span = StageSpan(name, size)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            self.record_stage(name, time.perf_counter() - start, span.size)
+            self.record_error(name, e)
+            raise
+        self.record_stage(name, time.perf_counter() - start, span.size)
+
+    def record_stage(self, name: str, seconds: float, size: Optional[int]):
+        pass
+
+    def record_error(self, name: str, error: Exception):
+        pass
+
+    def record_document(self, document: Document):
+        """
+        Called with every parsed document, e.g. to count its validation errors
+        """
+        pass
+
+
+class PrometheusStageRecorder(StageRecorder):
+    """
+    Exports per stage duration and payload size histograms and counters of failures per stage and exception type
+    and of document validation errors and warnings per ErrorCode
+    """
+
+    def __init__(self, registry=None, namespace: str = 'mrz_analyzer'):
+        """
+        :param registry: prometheus_client CollectorRegistry, defaults to the global one
+        """
+        from prometheus_client import REGISTRY, Counter, Histogram
+        registry = registry if registry is not None else REGISTRY
+        self._stage_seconds = Histogram(
+            'stage_seconds', 'Duration of each analysis stage', ['stage'],
+            namespace=namespace, registry=registry, buckets=STAGE_SECONDS_BUCKETS,
+        )
+        self._payload_bytes = Histogram(
+            'stage_payload_bytes', 'Payload size handled by each analysis stage', ['stage'],
+            namespace=namespace, registry=registry, buckets=PAYLOAD_BYTES_BUCKETS,
+        )
+        self._errors = Counter(
+            'stage_errors', 'Exceptions raised by each analysis stage', ['stage', 'error'],
+            namespace=namespace, registry=registry,
+        )
+        self._document_errors = Counter(
+            'document_errors', 'Validation errors found in parsed documents', ['code'],
+            namespace=namespace, registry=registry,
+        )
+        self._document_warnings = Counter(
+            'document_warnings', 'Validation warnings found in parsed documents', ['code'],
+            namespace=namespace, registry=registry,
+        )
+
+    def record_stage(self, name: str, seconds: float, size: Optional[int]):
+        self._stage_seconds.labels(name).observe(seconds)
+        if size is not None:
+            self._payload_bytes.labels(name).observe(size)
+
+    def record_error(self, name: str, error: Exception):
+        self._errors.labels(name, type(error).__name__).inc()
+
+    def record_document(self, document: Document):
+        for error in document.fields.errors:
+            self._document_errors.labels(error.code.name).inc()
+        for warning in document.fields.warnings:
+            self._document_warnings.labels(warning.code.name).inc()
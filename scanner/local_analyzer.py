@@ -0,0 +1,58 @@
+from typing import List, Optional
+
+import pytesseract
+
+from parser.mrz_parser import Document, MRZParser
+from scanner.analyzer import DocumentAnalyzer, DocumentFile, read_document
+from scanner.instrumentation import StageRecorder
+from scanner.mrz_region import MRZRegionDetector
+
+MRZ_LINE_LENGTH = 30
+MRZ_CHAR_WHITELIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789<'
+
+
+class LocalMRZAnalyzer(DocumentAnalyzer):
+    """
+    Offline analyzer: finds the MRZ band on the back of the cédula with OpenCV,
+    reads it with Tesseract restricted to the MRZ charset and parses it.
+    The tesseract executable is pytesseract's process wide setting, see scanner.factories.configure_tesseract
+    """
+
+    def __init__(self, mrz_parser: MRZParser, lang: str = 'eng',
+                 region_detector: Optional[MRZRegionDetector] = None, recorder: Optional[StageRecorder] = None):
+        self._mrz_parser = mrz_parser
+        self._recorder = recorder or StageRecorder()
+        self._region_detector = region_detector or MRZRegionDetector()
+        self._lang = lang
+        self._tesseract_config = f'--psm 6 -c tessedit_char_whitelist={MRZ_CHAR_WHITELIST}'
+
+    def analyze_document_id(self, file: DocumentFile) -> Document:
+        stage = self._recorder.stage
+        with stage('read') as span:
+            file = read_document(file)
+            span.size = len(file)
+        with stage('decode', len(file)):
+            image = self._region_detector.decode(file)
+        with stage('crop'):
+            band = self._region_detector.crop(image)
+            if band is None:
+                band = image[int(image.shape[0] * 0.6):, :]
+        with stage('ocr'):
+            text = pytesseract.image_to_string(band, lang=self._lang, config=self._tesseract_config)
+        with stage('extract'):
+            mrz_text = self._extract_mrz_text_from_ocr(text)
+        with stage('parse'):
+            document = self._mrz_parser.parse(mrz_text)
+        self._recorder.record_document(document)
+        return document
+
+    @staticmethod
+    def _extract_mrz_text_from_ocr(text: str) -> str:
+        candidates: List[str] = []
+        for line in text.splitlines():
+            line = line.replace(' ', '').strip()
+            if len(line) >= MRZ_LINE_LENGTH - 6:
+                candidates.append(line[:MRZ_LINE_LENGTH].ljust(MRZ_LINE_LENGTH, '<'))
+        if len(candidates) < 3:
+            raise Exception('No document detected')
+        return '\n'.join(candidates[-3:])
@@ -0,0 +1,104 @@
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+class MRZRegionDetector:
+    """
+    Finds the three-line MRZ band of a TD1 document and returns it cropped, deskewed and
+    scaled down to what OCR needs, so the engine no longer receives the full photo.
+    Detection runs on a copy scaled to detection_width, the crop is taken from the full image.
+    """
+
+    def __init__(self, detection_width: int = 600, target_height: int = 150):
+        """
+        :param detection_width: width of the copy used to find the band, kernel sizes depend on it
+        :param target_height: the crop is scaled down (never up) to this height, about 50px per MRZ line
+        """
+        self._detection_width = detection_width
+        self._target_height = target_height
+
+    @staticmethod
+    def decode(file: Union[bytes, memoryview]) -> np.ndarray:
+        image = cv2.imdecode(np.frombuffer(file, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise Exception('Invalid image')
+        return image
+
+    def locate(self, gray: np.ndarray) -> Optional[Tuple[Tuple[float, float], Tuple[float, float], float]]:
+        """
+        Dark text on a light background turns into bright blobs with a blackhat, the MRZ is the
+        lowest wide and flat blob once the characters are closed together
+        :param gray: grayscale image
+        :return: rotated rect ((cx, cy), (w, h), angle) in full image coordinates, or None
+        """
+        height, width = gray.shape[:2]
+        scale = self._detection_width / width
+        small = cv2.resize(gray, (self._detection_width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(small, (3, 3), 0)
+        blackhat = cv2.morphologyEx(small, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5)))
+        gradient = np.absolute(cv2.Sobel(blackhat, ddepth=cv2.CV_32F, dx=1, dy=0, ksize=-1))
+        gradient = cv2.normalize(gradient, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+        gradient = cv2.morphologyEx(gradient, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7)))
+        _, thresh = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 21)))
+        thresh = cv2.erode(thresh, None, iterations=2)
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        best = None
+        best_y = -1.0
+        for contour in contours:
+            rect = cv2.minAreaRect(contour)
+            (cx, cy), _, _ = rect
+            # minAreaRect angle conventions changed between OpenCV releases, measure the long side instead
+            corners = cv2.boxPoints(rect)
+            long_side = corners[1] - corners[0]
+            short_side = corners[2] - corners[1]
+            if np.hypot(*long_side) < np.hypot(*short_side):
+                long_side, short_side = short_side, long_side
+            w = float(np.hypot(*long_side))
+            h = float(np.hypot(*short_side))
+            angle = float(np.degrees(np.arctan2(long_side[1], long_side[0])))
+            if angle > 90.0:
+                angle -= 180.0
+            elif angle <= -90.0:
+                angle += 180.0
+            if w < 0.6 * self._detection_width or w / max(h, 1.0) < 3.0:
+                continue
+            if cy > best_y:
+                best_y = cy
+                best = ((cx / scale, cy / scale), (w / scale, h / scale), angle)
+        return best
+
+    def crop(self, gray: np.ndarray) -> Optional[np.ndarray]:
+        """
+        :param gray: grayscale image
+        :return: the deskewed MRZ band with a small margin, or None if no band is found
+        """
+        rect = self.locate(gray)
+        if rect is None:
+            return None
+        (cx, cy), (w, h), angle = rect
+        w *= 1.06
+        h *= 1.2
+        factor = min(1.0, self._target_height / h)
+        out_w = max(1, int(round(w * factor)))
+        out_h = max(1, int(round(h * factor)))
+        # Rotate, scale and translate in a single warp that only computes the output pixels
+        matrix = cv2.getRotationMatrix2D((cx, cy), angle, factor)
+        matrix[0, 2] += out_w / 2.0 - cx
+        matrix[1, 2] += out_h / 2.0 - cy
+        return cv2.warpAffine(gray, matrix, (out_w, out_h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    def crop_to_png(self, file: Union[bytes, memoryview]) -> Optional[bytes]:
+        """
+        :param file: encoded image (png, jpg...)
+        :return: the MRZ band as a grayscale PNG, or None if no band is found
+        """
+        band = self.crop(self.decode(file))
+        if band is None:
+            return None
+        ok, encoded = cv2.imencode('.png', band, [cv2.IMWRITE_PNG_COMPRESSION, 3])
+        if not ok:
+            raise Exception('Could not encode the MRZ band')
+        return encoded.tobytes()
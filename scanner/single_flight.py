@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Dict
+
+from domain.model import Document
+from scanner.analyzer import AsyncDocumentAnalyzer, DocumentAnalyzer, DocumentFile, read_document
+from scanner.cache import content_key
+
+
+class SingleFlightDocumentAnalyzer(DocumentAnalyzer):
+    """
+    Concurrent analyses of the same image share a single call to the wrapped analyzer, e.g. a double submitted
+    upload pays one Textract round trip. Nothing is kept once the call finishes, see CachingDocumentAnalyzer for that
+    """
+
+    def __init__(self, analyzer: DocumentAnalyzer):
+        self._analyzer = analyzer
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def analyze_document_id(self, file: DocumentFile) -> Document:
+        file = read_document(file)
+        key = content_key(file)
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            document = self._analyzer.analyze_document_id(file)
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(document)
+        return document
+
+    def _finish(self, key: str):
+        # Removed before the result is published, a call arriving afterwards starts a new analysis
+        with self._lock:
+            del self._in_flight[key]
+
+
+class AsyncSingleFlightDocumentAnalyzer(AsyncDocumentAnalyzer):
+    """
+    SingleFlightDocumentAnalyzer for analyzers running on the event loop. The shared analysis runs as its own task,
+    so a caller that is cancelled (e.g. the client went away) does not cancel it for the others
+    """
+
+    def __init__(self, analyzer: AsyncDocumentAnalyzer):
+        self._analyzer = analyzer
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def analyze_document_id(self, file: DocumentFile) -> Document:
+        file = read_document(file)
+        key = content_key(file)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._analyzer.analyze_document_id(file))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    async def aclose(self):
+        await self._analyzer.aclose()
+
+    def _finish(self, key: str, task: asyncio.Task):
+        del self._in_flight[key]
+        if not task.cancelled():
+            # Every caller may have been cancelled already, mark the exception as retrieved
+            task.exception()
@@ -1,91 +1,311 @@
+import asyncio
+import logging
 import uuid
 from abc import abstractmethod, ABC
+from dataclasses import replace
+from typing import Optional, TYPE_CHECKING, Union
 
 from parser.mrz_parser import Document, MRZParser
-from scanner.analyzer import DocumentAnalyzer
+from scanner.analyzer import AsyncDocumentAnalyzer, DocumentAnalyzer, DocumentFile, read_document
+from scanner.instrumentation import StageRecorder
+from scanner.textract_mrz import TextractMRZExtraction, extract_mrz_from_response
+
+if TYPE_CHECKING:
+    from scanner.aws_clients import AWSClientProvider
+    from scanner.mrz_region import MRZRegionDetector
+
+logger = logging.getLogger(__name__)
+
+# Biggest payload sent inline as Bytes, bigger files go through S3
+TEXTRACT_INLINE_MAX_BYTES = 5 * 1024 * 1024
+
+
+def parse_extraction(mrz_parser: MRZParser, extraction: TextractMRZExtraction) -> Document:
+    """
+    Parse the extracted MRZ, the Textract confidence of its lines is kept apart as metadata.ocr_confidence
+    """
+    document = mrz_parser.parse(extraction.text)
+    return replace(document, metadata=replace(document.metadata, ocr_confidence=extraction.confidence))
 
 
 class TextractClient(ABC):
+    # Clients that implement analyze_id_bytes set it, the analyzer goes through S3 otherwise
+    supports_inline_bytes = False
+
     @abstractmethod
     def analyze_id(self, file_name, bucket_name):
         pass
 
+    def analyze_id_bytes(self, file: bytes):
+        """
+        Analyze a document sent inline instead of through S3, only called when supports_inline_bytes is set
+        """
+        raise NotImplementedError()
+
 
 class Boto3TextractClient(TextractClient):
+    supports_inline_bytes = True
 
     def __init__(self, textract_client):
         self._client = textract_client
 
+    @classmethod
+    def from_provider(cls, provider: 'AWSClientProvider', region_name: Optional[str] = None) -> 'Boto3TextractClient':
+        return cls(provider.client('textract', region_name=region_name))
+
     def analyze_id(self, file_name, bucket_name) -> dict:
         return self._client.analyze_id(
             DocumentPages=[{'S3Object': {'Bucket': bucket_name, 'Name': file_name}}],
         )
 
+    def analyze_id_bytes(self, file: bytes) -> dict:
+        if isinstance(file, memoryview):
+            # botocore only accepts bytes, bytearray or file-like objects for blobs
+            file = file.tobytes()
+        return self._client.analyze_id(
+            DocumentPages=[{'Bytes': file}],
+        )
+
 
 class S3Client(ABC):
+    # Clients that implement delete_object set it, uploads are left to the bucket lifecycle otherwise
+    supports_delete = False
+
     @abstractmethod
     def put_object(self, bucket, key, body):
         pass
 
+    def delete_object(self, bucket, key):
+        raise NotImplementedError()
+
 
 class Boto3S3Client(S3Client):
+    supports_delete = True
 
     def __init__(self, s3_client):
         self._client = s3_client
 
+    @classmethod
+    def from_provider(cls, provider: 'AWSClientProvider', region_name: Optional[str] = None) -> 'Boto3S3Client':
+        return cls(provider.client('s3', region_name=region_name))
+
     def put_object(self, bucket: str, key: str, body: str):
+        if isinstance(body, memoryview):
+            body = body.tobytes()
         self._client.put_object(Bucket=bucket, Key=key, Body=body)
 
+    def delete_object(self, bucket: str, key: str):
+        self._client.delete_object(Bucket=bucket, Key=key)
+
+
+class AsyncTextractClient(ABC):
+    supports_inline_bytes = False
+
+    @abstractmethod
+    async def analyze_id(self, file_name, bucket_name):
+        pass
+
+    async def analyze_id_bytes(self, file: bytes):
+        raise NotImplementedError()
+
+    async def aclose(self):
+        """
+        Release the underlying client, nothing to do by default
+        """
+
+
+class AioBotocoreTextractClient(AsyncTextractClient):
+    """
+    :param textract_client: an opened aiobotocore textract client, see scanner.aws_clients.open_aio_client,
+        aclose closes it
+    """
+    supports_inline_bytes = True
+
+    def __init__(self, textract_client):
+        self._client = textract_client
+
+    async def analyze_id(self, file_name, bucket_name) -> dict:
+        return await self._client.analyze_id(
+            DocumentPages=[{'S3Object': {'Bucket': bucket_name, 'Name': file_name}}],
+        )
+
+    async def analyze_id_bytes(self, file: bytes) -> dict:
+        if isinstance(file, memoryview):
+            file = file.tobytes()
+        return await self._client.analyze_id(
+            DocumentPages=[{'Bytes': file}],
+        )
+
+    async def aclose(self):
+        await self._client.close()
 
-class TextractColCedulaMRZAnalyzer(DocumentAnalyzer):
-    def __init__(self, textract_client: TextractClient, s3_client: S3Client, bucket_name: str, mrz_parser: MRZParser):
+
+class AsyncS3Client(ABC):
+    supports_delete = False
+
+    @abstractmethod
+    async def put_object(self, bucket, key, body):
+        pass
+
+    async def delete_object(self, bucket, key):
+        raise NotImplementedError()
+
+    async def aclose(self):
+        """
+        Release the underlying client, nothing to do by default
+        """
+
+
+class AioBotocoreS3Client(AsyncS3Client):
+    supports_delete = True
+
+    def __init__(self, s3_client):
+        self._client = s3_client
+
+    async def put_object(self, bucket: str, key: str, body: str):
+        if isinstance(body, memoryview):
+            body = body.tobytes()
+        await self._client.put_object(Bucket=bucket, Key=key, Body=body)
+
+    async def delete_object(self, bucket: str, key: str):
+        await self._client.delete_object(Bucket=bucket, Key=key)
+
+    async def aclose(self):
+        await self._client.close()
+
+
+class _TextractPipeline:
+    """
+    Steps shared by TextractColCedulaMRZAnalyzer and AsyncTextractColCedulaMRZAnalyzer, the analyzers only
+    differ in how they wait on Textract and S3
+    """
+
+    def __init__(self, textract_client: Union[TextractClient, AsyncTextractClient],
+                 s3_client: Union[S3Client, AsyncS3Client], bucket_name: str, mrz_parser: MRZParser,
+                 inline_max_bytes: int = TEXTRACT_INLINE_MAX_BYTES,
+                 region_detector: Optional['MRZRegionDetector'] = None, recorder: Optional[StageRecorder] = None):
+        """
+        :param inline_max_bytes: files up to this size are sent inline, bigger ones go through S3
+        :param region_detector: if set, only the MRZ band is sent to Textract when it can be found
+        :param recorder: receives the duration and payload size of every stage
+        """
         self._textract_client = textract_client
         self._s3_client = s3_client
         self._bucket_name = bucket_name
         self._mrz_parser = mrz_parser
+        self._inline_max_bytes = inline_max_bytes
+        self._region_detector = region_detector
+        self._recorder = recorder or StageRecorder()
+
+    def _read(self, file: DocumentFile) -> Union[bytes, memoryview]:
+        with self._recorder.stage('read') as span:
+            file = read_document(file)
+            span.size = len(file)
+        return file
+
+    def _crop(self, file: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+        """
+        CPU bound, only called when a region_detector is set
+        :return: the MRZ band, or file when it cannot be found
+        """
+        with self._recorder.stage('crop', len(file)) as span:
+            band = self._region_detector.crop_to_png(file)
+            if band is None:
+                return file
+            span.size = len(band)
+        return band
+
+    def _sends_inline(self, file: Union[bytes, memoryview]) -> bool:
+        return self._textract_client.supports_inline_bytes and len(file) <= self._inline_max_bytes
+
+    def _document_from_response(self, response: dict) -> Document:
+        with self._recorder.stage('extract'):
+            extraction = extract_mrz_from_response(response)
+        with self._recorder.stage('parse'):
+            document = parse_extraction(self._mrz_parser, extraction)
+        self._recorder.record_document(document)
+        return document
+
+    def _log_failed_delete(self, file_name: str):
+        # Best effort, a failed delete never discards the analysis
+        logger.warning('Could not delete s3://%s/%s', self._bucket_name, file_name, exc_info=True)
+
+
+class TextractColCedulaMRZAnalyzer(_TextractPipeline, DocumentAnalyzer):
+    _textract_client: TextractClient
+    _s3_client: S3Client
 
-    def analyze_document_id(self, file: bytes) -> Document:
-        file_name = self._upload_to_s3(file)
-        mrz_text = self._analyze_using_textract(file_name)
-        return self._mrz_parser.parse(mrz_text)
+    def analyze_document_id(self, file: DocumentFile) -> Document:
+        file = self._read(file)
+        if self._region_detector is not None:
+            file = self._crop(file)
+        if self._sends_inline(file):
+            with self._recorder.stage('textract', len(file)):
+                response = self._textract_client.analyze_id_bytes(file)
+        else:
+            file_name = self._upload_to_s3(file)
+            try:
+                with self._recorder.stage('textract', len(file)):
+                    response = self._textract_client.analyze_id(file_name, self._bucket_name)
+            finally:
+                self._delete_from_s3(file_name)
+        return self._document_from_response(response)
 
     def _upload_to_s3(self, file: bytes) -> str:
         random_file_name = str(uuid.uuid4())
-        self._s3_client.put_object(self._bucket_name, random_file_name, file)
+        with self._recorder.stage('upload', len(file)):
+            self._s3_client.put_object(self._bucket_name, random_file_name, file)
+        return random_file_name
+
+    def _delete_from_s3(self, file_name: str):
+        if not self._s3_client.supports_delete:
+            return
+        try:
+            with self._recorder.stage('delete'):
+                self._s3_client.delete_object(self._bucket_name, file_name)
+        except Exception:
+            self._log_failed_delete(file_name)
+
+
+class AsyncTextractColCedulaMRZAnalyzer(_TextractPipeline, AsyncDocumentAnalyzer):
+    """
+    Same pipeline as TextractColCedulaMRZAnalyzer on async clients, so many documents can wait
+    on AWS at the same time on a single event loop. Only the MRZ crop, which is CPU bound, runs on a thread
+    """
+    _textract_client: AsyncTextractClient
+    _s3_client: AsyncS3Client
+
+    async def analyze_document_id(self, file: DocumentFile) -> Document:
+        file = self._read(file)
+        if self._region_detector is not None:
+            file = await asyncio.to_thread(self._crop, file)
+        if self._sends_inline(file):
+            with self._recorder.stage('textract', len(file)):
+                response = await self._textract_client.analyze_id_bytes(file)
+        else:
+            file_name = await self._upload_to_s3(file)
+            try:
+                with self._recorder.stage('textract', len(file)):
+                    response = await self._textract_client.analyze_id(file_name, self._bucket_name)
+            finally:
+                await self._delete_from_s3(file_name)
+        return self._document_from_response(response)
+
+    async def aclose(self):
+        await self._textract_client.aclose()
+        await self._s3_client.aclose()
+
+    async def _upload_to_s3(self, file: bytes) -> str:
+        random_file_name = str(uuid.uuid4())
+        with self._recorder.stage('upload', len(file)):
+            await self._s3_client.put_object(self._bucket_name, random_file_name, file)
         return random_file_name
 
-    def _analyze_using_textract(self, file_name) -> str:
-        response = self._textract_client.analyze_id(file_name, self._bucket_name)
-        return self._extract_mrz_text_from_response(response)
-
-    @staticmethod
-    def _extract_mrz_text_from_response(response) -> str:
-        if 'IdentityDocuments' not in response or len(response['IdentityDocuments']) <= 0:
-            raise Exception('No document detected')
-        confidence = 0.0
-        doc = response['IdentityDocuments'][0]
-        if 'Blocks' not in doc or len(doc['Blocks']) <= 0:
-            raise Exception('No document detected')
-        mrz_line_1 = ''
-        mrz_line_2 = ''
-        mrz_line_3 = ''
-        for i in range(0, len(doc['Blocks'])):
-            b = doc['Blocks'][i]
-            if 'BlockType' not in b or 'Text' not in b:
-                continue
-            block_type = b['BlockType']
-            content: str = b['Text'].strip().replace(' ', '')
-            if block_type == 'LINE':
-                if content == '.CO':
-                    confidence += 10.0
-                if content == 'REGISTRADOR NACIONAL':
-                    confidence += 10.0
-                if content.startswith('ICCOL'):
-                    confidence += 10.0
-                    if len(doc['Blocks']) >= i + 2:
-                        mrz_line_1 = doc['Blocks'][i]['Text']
-                        mrz_line_2 = doc['Blocks'][i + 1]['Text']
-                        mrz_line_3 = doc['Blocks'][i + 2]['Text']
-        if len(mrz_line_1) == 0 or len(mrz_line_2) == 0 or len(mrz_line_3) == 0:
-            raise Exception('No document detected')
-        return f"{mrz_line_1}\n{mrz_line_2}\n{mrz_line_3}"
+    async def _delete_from_s3(self, file_name: str):
+        if not self._s3_client.supports_delete:
+            return
+        try:
+            with self._recorder.stage('delete'):
+                await self._s3_client.delete_object(self._bucket_name, file_name)
+        except Exception:
+            self._log_failed_delete(file_name)
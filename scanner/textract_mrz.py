@@ -0,0 +1,126 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+_MRZ_CHARS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789<')
+# Characters outside _MRZ_CHARS tolerated in a line before it is not considered MRZ anymore
+_MAX_NOISE_CHARS = 2
+# Textract often trims the trailing '<' of the name line, e.g. "PAZ<<ANA", so only the
+# first two lines are held to _MIN_FULL_LINE_LENGTH, in _score
+_MIN_LINE_LENGTH = 4
+_MAX_LINE_LENGTH = 32
+# First two lines of a TD1 MRZ are 30 chars
+_MIN_FULL_LINE_LENGTH = 28
+_MIN_SCORE = 3
+# Text printed on the cedula that confirms the side holding the MRZ
+_MARKERS = frozenset(('.CO', 'REGISTRADORNACIONAL'))
+
+
+@dataclass()
+class TextractMRZExtraction:
+    lines: Tuple[str, str, str]
+    # Lowest Textract confidence of the three lines, 0-100
+    confidence: float
+    # Whether the cedula markers ('.CO', 'REGISTRADOR NACIONAL') were found on the same page
+    has_markers: bool
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self.lines)
+
+
+@dataclass()
+class _Line:
+    text: str
+    top: float
+    confidence: float
+
+
+def extract_mrz_from_response(response: dict) -> TextractMRZExtraction:
+    """
+    Find the TD1 MRZ in an AnalyzeID response in a single pass over its blocks.
+    Lines are grouped by the PAGE they belong to (CHILD relationships) and ordered by their bounding box,
+    not by their position in the response, then the three consecutive MRZ shaped lines that look the most
+    like a cedula MRZ are picked
+    :param response: AnalyzeID response, with one or many IdentityDocuments
+    :return: TextractMRZExtraction
+    """
+    best: Optional[Tuple[int, TextractMRZExtraction]] = None
+    for document in response.get('IdentityDocuments') or ():
+        for page_lines, has_markers in _mrz_lines_by_page(document.get('Blocks') or ()):
+            page_lines.sort(key=lambda line: line.top)
+            for i in range(len(page_lines) - 2):
+                l1, l2, l3 = page_lines[i:i + 3]
+                score = _score(l1.text, l2.text, l3.text)
+                if score < _MIN_SCORE or (best is not None and score <= best[0]):
+                    continue
+                best = (score, TextractMRZExtraction(
+                    lines=(l1.text, l2.text, l3.text),
+                    confidence=min(l1.confidence, l2.confidence, l3.confidence),
+                    has_markers=has_markers,
+                ))
+    if best is None:
+        raise Exception('No document detected')
+    return best[1]
+
+
+def _mrz_lines_by_page(blocks) -> List[Tuple[List[_Line], bool]]:
+    """
+    :return: per page, its MRZ shaped lines and whether the cedula markers are on it
+    """
+    page_of: Dict[str, str] = {}
+    lines: Dict[str, _Line] = {}
+    markers = set()
+    for index, block in enumerate(blocks):
+        block_type = block.get('BlockType')
+        if block_type == 'PAGE':
+            for relationship in block.get('Relationships') or ():
+                if relationship.get('Type') == 'CHILD':
+                    for child_id in relationship.get('Ids') or ():
+                        page_of[child_id] = block.get('Id')
+            continue
+        if block_type != 'LINE' or 'Text' not in block:
+            continue
+        text = block['Text'].replace(' ', '').upper()
+        block_id = block.get('Id') or f'#{index}'
+        if text in _MARKERS:
+            markers.add(block_id)
+            continue
+        if not _is_mrz_shaped(text):
+            continue
+        box = (block.get('Geometry') or {}).get('BoundingBox') or {}
+        lines[block_id] = _Line(text=text, top=box.get('Top', float(index)), confidence=block.get('Confidence', 0.0))
+    pages: Dict[Optional[str], List[_Line]] = {}
+    for block_id, line in lines.items():
+        pages.setdefault(page_of.get(block_id), []).append(line)
+    pages_with_markers = {page_of.get(block_id) for block_id in markers}
+    return [(page_lines, page in pages_with_markers) for page, page_lines in pages.items()]
+
+
+def _is_mrz_shaped(text: str) -> bool:
+    if not _MIN_LINE_LENGTH <= len(text) <= _MAX_LINE_LENGTH or '<' not in text:
+        return False
+    noise = 0
+    for char in text:
+        if char not in _MRZ_CHARS:
+            noise += 1
+            if noise > _MAX_NOISE_CHARS:
+                return False
+    return True
+
+
+def _score(l1: str, l2: str, l3: str) -> int:
+    """
+    How much three consecutive lines look like a Colombian TD1 MRZ
+    """
+    if len(l1) < _MIN_FULL_LINE_LENGTH or len(l2) < _MIN_FULL_LINE_LENGTH:
+        return 0
+    score = 0
+    if l1[0] in 'IACL1|':
+        score += 1
+    if l1[2:5].replace('0', 'O') == 'COL':
+        score += 2
+    if sum(char.isdigit() for char in l2[0:7]) >= 6:
+        score += 2
+    if '<<' in l3 and l3[0].isalpha():
+        score += 1
+    return score
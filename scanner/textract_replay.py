@@ -0,0 +1,125 @@
+import json
+import mmap
+import os
+import sys
+from typing import Callable, Iterator, Optional
+
+from parser.colombian_mrz_parser import ColombianMRZParser
+from scanner.bulk import BulkItem
+from scanner.textract_analyzer import S3Client, TextractClient, TextractColCedulaMRZAnalyzer
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    _loads = json.loads
+
+
+def load_response(data: bytes) -> dict:
+    """
+    :param data: a stored AnalyzeID response as JSON, or a {"filename": ..., "response": {...}} envelope
+    """
+    response = _loads(data)
+    if 'IdentityDocuments' not in response and 'response' in response:
+        response = response['response']
+    return response
+
+
+class ReplayTextractClient(TextractClient):
+    """
+    Answers with stored AnalyzeID responses instead of calling AWS: the "image" sent inline is
+    the stored response itself, and analyze_id reads <directory>/<file_name>
+    """
+
+    supports_inline_bytes = True
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+
+    def analyze_id(self, file_name, bucket_name) -> dict:
+        if self._directory is None:
+            raise Exception('ReplayTextractClient has no directory to read stored responses from')
+        with open(os.path.join(self._directory, file_name), 'rb') as f:
+            return load_response(f.read())
+
+    def analyze_id_bytes(self, file: bytes) -> dict:
+        return load_response(file)
+
+
+class _NoUploadS3Client(S3Client):
+
+    def put_object(self, bucket, key, body):
+        raise Exception('Replay mode never uploads to S3')
+
+
+def create_replay_analyzer(correct_ocr: bool = False) -> TextractColCedulaMRZAnalyzer:
+    """
+    Textract analyzer wired to ReplayTextractClient, every stored response is sent inline whatever its size
+    """
+    corrector = None
+    if correct_ocr:
+        from parser.mrz_correction import MRZCorrector
+        corrector = MRZCorrector()
+    return TextractColCedulaMRZAnalyzer(
+        ReplayTextractClient(), _NoUploadS3Client(), '', ColombianMRZParser(corrector=corrector),
+        inline_max_bytes=sys.maxsize,
+    )
+
+
+def iter_stored_responses(path: str, skip: Optional[Callable[[str], bool]] = None) -> Iterator[BulkItem]:
+    """
+    Read stored responses one at a time, to be replayed with create_replay_analyzer
+    :param path: directory of .json responses (recursively) or an NDJSON file with one response per line,
+        the NDJSON file is memory-mapped and lines are sliced out of it as they are consumed
+    :param skip: names for which it returns True are not replayed, e.g. Checkpoint.is_done
+    :return: (name, response bytes) pairs, NDJSON lines are named by the filename of their envelope
+        (which should be unique), or <file name>:<line number> when they have none
+    """
+    skip = skip or (lambda name: False)
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                full_path = os.path.join(root, file_name)
+                name = os.path.relpath(full_path, path)
+                if name.lower().endswith('.json') and not skip(name):
+                    with open(full_path, 'rb') as f:
+                        yield name, f.read()
+        return
+    base_name = os.path.basename(path)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            line_number = 0
+            size = len(mapped)
+            while start < size:
+                end = mapped.find(b'\n', start)
+                if end == -1:
+                    end = size
+                line_number += 1
+                line = mapped[start:end]
+                start = end + 1
+                if not line.strip():
+                    continue
+                name = _envelope_filename(line) or f'{base_name}:{line_number}'
+                if not skip(name):
+                    yield name, line
+
+
+def _envelope_filename(line: bytes) -> Optional[str]:
+    """
+    :return: the filename of a {"filename": ..., "response": {...}} line, None for a bare response
+        or a line that is not valid JSON, which is reported when it is replayed
+    """
+    # Bare AnalyzeID responses have no "filename" key, they are not parsed twice
+    if b'"filename"' not in line:
+        return None
+    try:
+        envelope = _loads(line)
+    except ValueError:
+        return None
+    if not isinstance(envelope, dict) or 'IdentityDocuments' in envelope:
+        return None
+    filename = envelope.get('filename')
+    return filename if isinstance(filename, str) and filename else None
@@ -0,0 +1,86 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class WorkerPoolSaturatedError(Exception):
+    pass
+
+
+class BoundedWorkerPool:
+    """
+    Runs blocking calls (boto3, OCR) on a thread pool so they do not stall the event loop.
+    At most max_workers calls run at the same time and at most max_queue more wait for a worker,
+    any call beyond that is rejected right away with WorkerPoolSaturatedError.
+    A call counts as pending until its thread is done with it, even if the caller stopped waiting (cancelled),
+    so an abandoned call still holds its slot while it runs.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        if max_workers <= 0:
+            raise ValueError('max_workers must be greater than 0')
+        if max_queue < 0:
+            raise ValueError('max_queue must not be negative')
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analyzer')
+        self._max_workers = max_workers
+        self._max_pending = max_workers + max_queue
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._async_slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of calls running or waiting for a worker
+        """
+        return self._pending
+
+    @property
+    def queued(self) -> int:
+        return max(0, self._pending - self._max_workers)
+
+    def is_saturated(self) -> bool:
+        return self._pending >= self._max_pending
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        self._acquire()
+        try:
+            future = self._executor.submit(functools.partial(fn, *args))
+        except BaseException:
+            self._release()
+            raise
+        # Released by the executor future, not by this coroutine: cancelling the await does not stop the thread
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def run_async(self, fn: Callable[..., Awaitable[T]], *args) -> T:
+        """
+        Same limits as run for coroutine functions (async analyzers): they run on the event loop
+        instead of a thread, but still at most max_workers at a time
+        """
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self._max_workers)
+        self._acquire()
+        try:
+            async with self._async_slots:
+                return await fn(*args)
+        finally:
+            # The coroutine runs on the loop, once it is cancelled nothing keeps running
+            self._release()
+
+    def _acquire(self):
+        with self._pending_lock:
+            if self._pending >= self._max_pending:
+                raise WorkerPoolSaturatedError('Worker pool saturated')
+            self._pending += 1
+
+    def _release(self, future: Optional[Future] = None):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
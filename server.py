@@ -1,43 +1,320 @@
-from fastapi import FastAPI, File, UploadFile
+import asyncio
+import io
+import zipfile
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+from fastapi import APIRouter, FastAPI, File, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import os
-import boto3
-
-from parser.colombian_mrz_parser import ColombianMRZParser
-from scanner.textract_analyzer import Boto3TextractClient, Boto3S3Client, TextractColCedulaMRZAnalyzer
-
-
-def create_analyzer() -> TextractColCedulaMRZAnalyzer:
-    aws_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
-    if not aws_key_id:
-        raise Exception("AWS_ACCESS_KEY_ID not set")
-    bucket_name = os.environ.get('AWS_BUCKET_NAME')
-    if not bucket_name:
-        raise Exception("AWS_BUCKET_NAME not set")
-
-    region_name = os.environ.get('AWS_REGION_NAME')
-    if not region_name:
-        raise Exception("AWS_REGION_NAME not set")
-
-    session = boto3.Session()
-    _textract_client = session.client('textract', region_name=region_name)
-    textract_client = Boto3TextractClient(_textract_client)
-    _s3_client = session.client('s3')
-    s3_client = Boto3S3Client(_s3_client)
-    return TextractColCedulaMRZAnalyzer(
-        textract_client, s3_client, bucket_name, ColombianMRZParser()
-    )
+
+from domain import serializer
+from scanner.analyzer import AsyncDocumentAnalyzer
+from scanner.cache import AsyncCachingDocumentAnalyzer, CachingDocumentAnalyzer
+from scanner.factories import AnyDocumentAnalyzer, create_analyzer
+from scanner.worker_pool import BoundedWorkerPool, WorkerPoolSaturatedError
+
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+# Room for the multipart boundary and part headers around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_CHUNK_BYTES = 64 * 1024
+BATCH_MAX_FILES = int(os.environ.get('ANALYZER_BATCH_MAX_FILES', '20'))
+BATCH_CONCURRENCY = int(os.environ.get('ANALYZER_BATCH_CONCURRENCY', '4'))
+# Uncompressed bytes a whole batch may expand to, zip entries included
+BATCH_MAX_BYTES = BATCH_MAX_FILES * MAX_UPLOAD_BYTES
+
+
+def create_worker_pool() -> BoundedWorkerPool:
+    max_workers = int(os.environ.get('ANALYZER_MAX_WORKERS', '8'))
+    max_queue = int(os.environ.get('ANALYZER_MAX_QUEUE', '32'))
+    return BoundedWorkerPool(max_workers, max_queue)
+
+
+class DocumentJSONResponse(JSONResponse):
+    """
+    Renders Document results with domain.serializer instead of FastAPI's reflective jsonable_encoder.
+    Endpoints must return it directly, a plain return value still goes through jsonable_encoder
+    """
+
+    def render(self, content) -> bytes:
+        return serializer.dumps(content)
+
+
+class _BodyTooLargeError(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """
+    Rejects requests whose body is bigger than max_body_size with a 413 before it is buffered:
+    up front from Content-Length, or while streaming when the header is missing or lies
+    """
+
+    def __init__(self, app, max_body_size: int, path_limits: Optional[Dict[str, int]] = None):
+        """
+        :param max_body_size: default limit in bytes
+        :param path_limits: limit for specific paths, e.g. batch endpoints
+        """
+        self.app = app
+        self._max_body_size = max_body_size
+        self._path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        max_body_size = self._path_limits.get(scope['path'], self._max_body_size)
+        for name, value in scope['headers']:
+            if name == b'content-length':
+                if not value.isdigit() or int(value) > max_body_size:
+                    await self._reject(scope, receive, send)
+                    return
+                break
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > max_body_size:
+                    if not response_started:
+                        await self._reject(scope, receive, send)
+                        rejected = True
+                    # Stops the app reading, whatever it makes of the error is not sent once rejected
+                    raise _BodyTooLargeError()
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except _BodyTooLargeError:
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _reject(scope, receive, send):
+        response = JSONResponse(status_code=413, content={"result": "file too big"})
+        await response(scope, receive, send)
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+async def read_upload(file: UploadFile, max_size: int) -> memoryview:
+    """
+    Read an upload in chunks, giving up as soon as it grows past max_size
+    :return: a view over the content, no extra bytes copy is made
+    """
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > max_size:
+            raise UploadTooLargeError()
+    return memoryview(buffer)
+
+
+class BatchTooLargeError(Exception):
+    pass
 
 
-app = FastAPI()
-analyzer = create_analyzer()
+def _expand_zip(filename: str, contents: memoryview, max_entries: int, max_bytes: int) -> List[dict]:
+    """
+    Blocking, run it on a thread
+    :param max_entries: files the archive may hold, checked before anything is decompressed
+    :param max_bytes: uncompressed bytes the archive may expand to
+    :return: one batch item per file inside the archive, entries bigger than MAX_UPLOAD_BYTES get an error
+    :raise BatchTooLargeError: when either limit is exceeded
+    """
+    items = []
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(contents))
+    except zipfile.BadZipFile:
+        return [{"filename": filename, "status": 400, "result": "invalid zip file"}]
+    with archive:
+        entries = [info for info in archive.infolist() if not info.is_dir()]
+        if len(entries) > max_entries:
+            raise BatchTooLargeError()
+        total = 0
+        for info in entries:
+            entry_name = f"{filename}/{info.filename}"
+            if info.file_size > MAX_UPLOAD_BYTES:
+                items.append({"filename": entry_name, "status": 413, "result": "file too big"})
+                continue
+            with archive.open(info) as f:
+                # Never trust the declared size, a crafted archive can inflate past it
+                entry = f.read(MAX_UPLOAD_BYTES + 1)
+            total += len(entry)
+            if total > max_bytes:
+                raise BatchTooLargeError()
+            if len(entry) > MAX_UPLOAD_BYTES:
+                items.append({"filename": entry_name, "status": 413, "result": "file too big"})
+            else:
+                items.append({"filename": entry_name, "contents": entry})
+    return items
 
 
-@app.post("/analyze")
-async def analyze_endpoint(file: UploadFile = File(...)):
-    contents = await file.read()
+async def _collect_batch(files: List[UploadFile]) -> List[dict]:
+    """
+    :raise BatchTooLargeError: when the files, zip entries included, are more than BATCH_MAX_FILES
+        or expand to more than BATCH_MAX_BYTES
+    """
+    items = []
+    total = 0
+    for file in files:
+        try:
+            contents = await read_upload(file, MAX_UPLOAD_BYTES)
+        except UploadTooLargeError:
+            items.append({"filename": file.filename, "status": 413, "result": "file too big"})
+            continue
+        if (file.filename or '').lower().endswith('.zip') or file.content_type in ('application/zip',
+                                                                                  'application/x-zip-compressed'):
+            entries = await run_in_threadpool(
+                _expand_zip, file.filename, contents, BATCH_MAX_FILES - len(items), BATCH_MAX_BYTES - total
+            )
+            items.extend(entries)
+            total += sum(len(item["contents"]) for item in entries if "contents" in item)
+        else:
+            items.append({"filename": file.filename, "contents": contents})
+            total += len(contents)
+        if len(items) > BATCH_MAX_FILES or total > BATCH_MAX_BYTES:
+            raise BatchTooLargeError()
+    for index, item in enumerate(items):
+        item["index"] = index
+        if "contents" in item and len(item["contents"]) == 0:
+            del item["contents"]
+            item.update(status=400, result="empty file")
+    return items
+
+
+async def _run_analysis(analyzer: AnyDocumentAnalyzer, worker_pool: BoundedWorkerPool, contents: memoryview):
+    if isinstance(analyzer, AsyncDocumentAnalyzer):
+        return await worker_pool.run_async(analyzer.analyze_document_id, contents)
+    return await worker_pool.run(analyzer.analyze_document_id, contents)
+
+
+async def _analyze_batch_item(item: dict, analyzer: AnyDocumentAnalyzer, worker_pool: BoundedWorkerPool,
+                              semaphore: asyncio.Semaphore) -> dict:
+    if "contents" not in item:
+        return item
+    contents = item.pop("contents")
+    async with semaphore:
+        try:
+            result = await _run_analysis(analyzer, worker_pool, contents)
+        except WorkerPoolSaturatedError:
+            return {**item, "status": 429, "result": "too many requests"}
+        except Exception as e:
+            return {**item, "status": 422, "result": str(e)}
+    return {**item, "status": 200, "result": result}
+
+
+async def _stream_batch_results(items: List[dict], analyzer: AnyDocumentAnalyzer, worker_pool: BoundedWorkerPool):
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.ensure_future(_analyze_batch_item(item, analyzer, worker_pool, semaphore)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            yield serializer.dumps(result) + b"\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+router = APIRouter()
+
+
+@router.post("/analyze")
+async def analyze_endpoint(request: Request, file: UploadFile = File(...)):
+    try:
+        contents = await read_upload(file, MAX_UPLOAD_BYTES)
+    except UploadTooLargeError:
+        return JSONResponse(status_code=413, content={"filename": file.filename, "result": "file too big"})
     if len(contents) == 0:
-        return {"filename": file.filename, "result": "empty file"}, 400
-    if len(contents) > 5 * 1024 * 1024:
-        return {"filename": file.filename, "result": "file too big"}, 413
-    result = analyzer.analyze_document_id(contents)
-    return {"filename": file.filename, "result": result}
+        return JSONResponse(status_code=400, content={"filename": file.filename, "result": "empty file"})
+    state = request.app.state
+    try:
+        result = await _run_analysis(state.analyzer, state.worker_pool, contents)
+    except WorkerPoolSaturatedError:
+        return JSONResponse(
+            status_code=429,
+            content={"filename": file.filename, "result": "too many requests"},
+            headers={"Retry-After": "1"},
+        )
+    return DocumentJSONResponse(content={"filename": file.filename, "result": result})
+
+
+@router.post("/analyze/batch")
+async def analyze_batch_endpoint(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Analyze several images (or zip archives of images) concurrently.
+    Results are streamed as NDJSON in completion order, each line carries the index of its file
+    """
+    if len(files) > BATCH_MAX_FILES:
+        return JSONResponse(status_code=413, content={"result": f"too many files, max {BATCH_MAX_FILES}"})
+    try:
+        items = await _collect_batch(files)
+    except BatchTooLargeError:
+        return JSONResponse(status_code=413, content={"result": f"too many files, max {BATCH_MAX_FILES}"})
+    state = request.app.state
+    return StreamingResponse(
+        _stream_batch_results(items, state.analyzer, state.worker_pool), media_type="application/x-ndjson"
+    )
+
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/cache/stats")
+async def cache_stats_endpoint(request: Request):
+    analyzer = request.app.state.analyzer
+    if not isinstance(analyzer, (CachingDocumentAnalyzer, AsyncCachingDocumentAnalyzer)):
+        return {"enabled": False}
+    stats = analyzer.stats
+    return {"enabled": True, "hits": stats.hits, "misses": stats.misses, "hit_ratio": stats.hit_ratio}
+
+
+def create_app(analyzer_factory: Callable[[], AnyDocumentAnalyzer] = create_analyzer,
+               worker_pool_factory: Callable[[], BoundedWorkerPool] = create_worker_pool) -> FastAPI:
+    """
+    Build the API, the analyzer and the worker pool live on app.state for the lifespan of the app
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.analyzer = analyzer_factory()
+        app.state.worker_pool = worker_pool_factory()
+        try:
+            yield
+        finally:
+            app.state.worker_pool.shutdown(wait=False)
+            if isinstance(app.state.analyzer, AsyncDocumentAnalyzer):
+                await app.state.analyzer.aclose()
+
+    app = FastAPI(lifespan=lifespan, default_response_class=DocumentJSONResponse)
+    app.add_middleware(
+        BodySizeLimitMiddleware,
+        max_body_size=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        path_limits={"/analyze/batch": BATCH_MAX_FILES * (MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES)},
+    )
+    app.include_router(router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,116 @@
+"""
+Synthetic cedula MRZs for tests and benchmarks: valid TD1 triplets built with CheckDigitCalculator
+and LOCALITIES, realistic OCR corruptions of them and canned Textract AnalyzeID responses.
+Test helper, benchmarks/conftest.py puts this directory on sys.path for the benchmarks
+"""
+import datetime
+import random
+import uuid
+from typing import List, Optional
+
+from parser.locatilities import LOCALITIES
+from parser.mrz_parser import CheckDigitCalculator
+
+LAST_NAMES = ['WALTEROS', 'GOMEZ', 'RODRIGUEZ', 'MARTINEZ', 'GARCIA', 'LOPEZ', 'HERNANDEZ', 'DIAZ', 'MUNOZ',
+              'ROJAS', 'MORENO', 'JIMENEZ', 'VARGAS', 'CASTRO', 'OSPINA', 'VALENCIA']
+FIRST_NAMES = ['LAURA', 'JUAN', 'MARIA', 'CARLOS', 'ANDRES', 'DIANA', 'JOSE', 'LUZ', 'SANTIAGO', 'VALENTINA',
+               'CAMILO', 'PAULA', 'ALEJANDRO', 'NATALIA']
+
+# (from, to) misreadings seen in OCR output, split by the kind of field they hit
+LETTER_CONFUSIONS = [('0', 'O'), ('1', 'I'), ('8', 'B'), ('5', 'S'), ('2', 'Z'), ('0', 'D')]
+DIGIT_CONFUSIONS = [('8', '3'), ('3', '8'), ('1', '7'), ('7', '1'), ('6', '5'), ('5', '6'), ('0', '8')]
+# Positions of numeric data in (line, start, end)
+NUMERIC_FIELDS = [(0, 5, 15), (0, 15, 20), (1, 0, 7), (1, 8, 15), (1, 18, 28)]
+
+
+def _yymmdd(date: datetime.date) -> str:
+    return date.strftime('%y%m%d')
+
+
+class SyntheticCedulaGenerator:
+    """
+    Deterministic for a given seed
+    """
+
+    def __init__(self, seed: int = 0, today: Optional[datetime.date] = None):
+        self._rng = random.Random(seed)
+        self._today = today or datetime.date.today()
+
+    def lines(self) -> List[str]:
+        rng = self._rng
+        check = CheckDigitCalculator.compute_check_digit
+        doc_number = f'{rng.randrange(1, 10 ** 9):09d}'
+        mun_code, dep_code = rng.choice(LOCALITIES)[0:2]
+        l1 = f'ICCOL{doc_number}{check(doc_number.lstrip("0"))}{mun_code}{dep_code}'.ljust(30, '<')
+
+        # Birth dates stay within the last 100 years so the century pivot resolves them unambiguously
+        birth = self._today - datetime.timedelta(days=rng.randrange(18 * 365, 99 * 365))
+        expiration = self._today + datetime.timedelta(days=rng.randrange(0, 15 * 365))
+        nuip = f'{rng.randrange(10 ** 9, 10 ** 10)}'
+        l2 = (f'{_yymmdd(birth)}{check(_yymmdd(birth))}{rng.choice("MF")}'
+              f'{_yymmdd(expiration)}{check(_yymmdd(expiration))}COL{nuip}<')
+        l2 += CheckDigitCalculator.compute_composite_check_digit(l1, l2 + '<')
+
+        last_names = '<'.join(rng.sample(LAST_NAMES, 2))
+        first_names = '<'.join(rng.sample(FIRST_NAMES, rng.randint(1, 2)))
+        l3 = f'{last_names}<<{first_names}'[:30].ljust(30, '<')
+        return [l1, l2, l3]
+
+    def valid(self) -> str:
+        return '\n'.join(self.lines())
+
+    def corrupted(self, max_errors: int = 2) -> str:
+        """
+        A valid MRZ with 1 to max_errors OCR style misreadings in its numeric fields,
+        the name line sometimes also loses its trailing '<' as Textract does
+        """
+        rng = self._rng
+        lines = self.lines()
+        for _ in range(rng.randint(1, max_errors)):
+            line, start, end = rng.choice(NUMERIC_FIELDS)
+            chars = list(lines[line])
+            confusions = LETTER_CONFUSIONS if rng.random() < 0.6 else DIGIT_CONFUSIONS
+            positions = [(i, to) for i in range(start, end) for source, to in confusions if chars[i] == source]
+            if not positions:
+                continue
+            i, to = rng.choice(positions)
+            chars[i] = to
+            lines[line] = ''.join(chars)
+        if rng.random() < 0.5:
+            lines[2] = lines[2].rstrip('<') + '<' * rng.randint(0, 3)
+        return '\n'.join(lines)
+
+    def batch(self, size: int, corrupted_ratio: float = 0.0) -> List[str]:
+        return [self.corrupted() if self._rng.random() < corrupted_ratio else self.valid() for _ in range(size)]
+
+    def textract_response(self, mrz: str, noise_lines: int = 10, shuffle: bool = True) -> dict:
+        """
+        AnalyzeID response shaped like the real one: a PAGE block, LINE blocks with geometry and confidence
+        (the cedula markers, noise and the MRZ at the bottom) and the PAGE CHILD relationships
+        """
+        rng = self._rng
+        texts = ['.CO', 'REGISTRADOR NACIONAL', 'Alexander Vega Rocha']
+        texts += [' '.join(rng.sample(LAST_NAMES + FIRST_NAMES, 2)) for _ in range(noise_lines)]
+        lines = []
+        for i, text in enumerate(texts):
+            lines.append((text, 0.05 + 0.55 * i / max(len(texts), 1)))
+        for i, text in enumerate(mrz.split('\n')):
+            lines.append((text, 0.63 + 0.08 * i))
+        blocks = []
+        for text, top in lines:
+            blocks.append({
+                'BlockType': 'LINE',
+                'Id': str(uuid.UUID(int=rng.getrandbits(128))),
+                'Text': text,
+                'Confidence': rng.uniform(60.0, 99.9),
+                'Geometry': {'BoundingBox': {'Width': 0.8, 'Height': 0.06, 'Left': 0.09, 'Top': top}},
+            })
+        page = {
+            'BlockType': 'PAGE',
+            'Id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'Geometry': {'BoundingBox': {'Width': 1.0, 'Height': 1.0, 'Left': 0.0, 'Top': 0.0}},
+            'Relationships': [{'Type': 'CHILD', 'Ids': [b['Id'] for b in blocks]}],
+        }
+        if shuffle:
+            rng.shuffle(blocks)
+        return {'IdentityDocuments': [{'DocumentIndex': 1, 'Blocks': [page] + blocks}]}
@@ -1,38 +1,98 @@
+import asyncio
 import datetime
+import io
 import json
 import os
 import unittest
 from typing import Dict
 
 import boto3
+from prometheus_client import CollectorRegistry
 
 from domain.model import Sex
+from scanner.aws_clients import AWSClientConfig, AWSClientProvider
+from scanner.instrumentation import PrometheusStageRecorder, StageRecorder
 from parser.colombian_mrz_parser import ColombianMRZParser
+from scanner.textract_mrz import extract_mrz_from_response
 from scanner.textract_analyzer import TextractColCedulaMRZAnalyzer, TextractClient, S3Client, Boto3TextractClient, \
-    Boto3S3Client
+    Boto3S3Client, AsyncTextractClient, AsyncS3Client, AsyncTextractColCedulaMRZAnalyzer
 
 
 class FakeTextractClient(TextractClient):
+    supports_inline_bytes = True
 
     def __init__(self, response: Dict, error: Exception = None):
         super().__init__()
         self._response = response
         self._error = error
+        self.s3_calls = 0
+        self.bytes_calls = 0
 
     def analyze_id(self, file_name, bucket_name):
+        self.s3_calls += 1
+        if self._error:
+            raise self._error
+        return self._response
+
+    def analyze_id_bytes(self, file: bytes):
+        self.bytes_calls += 1
         if self._error:
             raise self._error
         return self._response
 
 
 class FakeS3Client(S3Client):
+    supports_delete = True
 
-    def __init__(self, error: Exception = None):
+    def __init__(self, error: Exception = None, delete_error: Exception = None):
         self._error = error
+        self._delete_error = delete_error
+        self.objects = {}
 
     def put_object(self, bucket, key, body):
         if self._error:
             raise self._error
+        self.objects[key] = body
+
+    def delete_object(self, bucket, key):
+        if self._delete_error:
+            raise self._delete_error
+        del self.objects[key]
+
+
+class FakeAsyncTextractClient(AsyncTextractClient):
+    supports_inline_bytes = True
+
+    def __init__(self, response: Dict, delay: float = 0.0):
+        self._response = response
+        self._delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def analyze_id(self, file_name, bucket_name):
+        return await self.analyze_id_bytes(b'')
+
+    async def analyze_id_bytes(self, file: bytes):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self._delay)
+        finally:
+            self.in_flight -= 1
+        return self._response
+
+
+class FakeAsyncS3Client(AsyncS3Client):
+    supports_delete = True
+
+    def __init__(self):
+        self.objects = {}
+
+    async def put_object(self, bucket, key, body):
+        self.objects[key] = body
+
+    async def delete_object(self, bucket, key):
+        del self.objects[key]
 
 
 class AnalyzerTestCase(unittest.TestCase):
@@ -66,6 +126,73 @@ class AnalyzerTestCase(unittest.TestCase):
         assert doc.fields.dep_code == "001"
         assert doc.fields.dep_name == "CARTAGENA"
 
+    def test_analizer_sends_small_files_inline_and_big_files_through_s3(self):
+        with open("data/fake_1_textract_resp.json", 'rb') as f:
+            resp_json = json.load(f)
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        textract_client = FakeTextractClient(resp_json)
+        s3_client = FakeS3Client()
+        a = TextractColCedulaMRZAnalyzer(
+            textract_client, s3_client, "bucket_name", ColombianMRZParser(),
+            inline_max_bytes=len(img_file_bytes),
+        )
+        a.analyze_document_id(img_file_bytes)
+        assert textract_client.bytes_calls == 1
+        assert textract_client.s3_calls == 0
+        a.analyze_document_id(img_file_bytes + b'\0')
+        assert textract_client.bytes_calls == 1
+        assert textract_client.s3_calls == 1
+        assert s3_client.objects == {}
+
+    def test_failed_s3_delete_keeps_the_analysis(self):
+        with open("data/fake_1_textract_resp.json", 'rb') as f:
+            resp_json = json.load(f)
+        s3_client = FakeS3Client(delete_error=Exception('AccessDenied'))
+        a = TextractColCedulaMRZAnalyzer(
+            FakeTextractClient(resp_json), s3_client, "bucket_name", ColombianMRZParser(), inline_max_bytes=0,
+        )
+        with self.assertLogs('scanner.textract_analyzer', level='WARNING'):
+            doc = a.analyze_document_id(b'image')
+        assert doc.fields.nuip == "1234567890"
+        assert len(s3_client.objects) == 1
+
+    def test_analizer_accepts_memoryview_and_file_objects(self):
+        with open("data/fake_1_textract_resp.json", 'rb') as f:
+            resp_json = json.load(f)
+        a = TextractColCedulaMRZAnalyzer(
+            FakeTextractClient(resp_json), FakeS3Client(), "bucket_name", ColombianMRZParser()
+        )
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        assert a.analyze_document_id(memoryview(bytearray(img_file_bytes))).fields.nuip == "1234567890"
+        assert a.analyze_document_id(io.BytesIO(img_file_bytes)).fields.nuip == "1234567890"
+        with open("data/fake_1.png", 'rb') as f:
+            assert a.analyze_document_id(f).fields.nuip == "1234567890"
+
+    def test_async_analizer_overlaps_documents(self):
+        with open("data/fake_1_textract_resp.json", 'rb') as f:
+            resp_json = json.load(f)
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        textract_client = FakeAsyncTextractClient(resp_json, delay=0.05)
+        s3_client = FakeAsyncS3Client()
+        a = AsyncTextractColCedulaMRZAnalyzer(
+            textract_client, s3_client, "bucket_name", ColombianMRZParser(), inline_max_bytes=len(img_file_bytes)
+        )
+
+        async def analyze_many():
+            return await asyncio.gather(
+                a.analyze_document_id(img_file_bytes),
+                a.analyze_document_id(img_file_bytes),
+                a.analyze_document_id(img_file_bytes + b'\0'),
+            )
+
+        docs = asyncio.run(analyze_many())
+        assert [d.fields.nuip for d in docs] == ["1234567890"] * 3
+        assert textract_client.max_in_flight == 3
+        assert s3_client.objects == {}
+
     def test_analizer_with_real_aws_services(self):
         aws_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
         if not aws_key_id:
@@ -86,3 +213,125 @@ class AnalyzerTestCase(unittest.TestCase):
         with open(img_file_name, 'rb') as f:
             img_file_bytes = f.read()
         a.analyze_document_id(img_file_bytes)
+
+
+class RecordingStageRecorder(StageRecorder):
+
+    def __init__(self):
+        self.stages = []
+        self.errors = []
+
+    def record_stage(self, name, seconds, size):
+        self.stages.append((name, size))
+
+    def record_error(self, name, error):
+        self.errors.append((name, type(error).__name__))
+
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def test_stages_are_recorded(self):
+        with open("data/fake_1_textract_resp.json", 'rb') as f:
+            resp_json = json.load(f)
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        recorder = RecordingStageRecorder()
+        a = TextractColCedulaMRZAnalyzer(
+            FakeTextractClient(resp_json), FakeS3Client(), "bucket_name", ColombianMRZParser(),
+            inline_max_bytes=0, recorder=recorder,
+        )
+        a.analyze_document_id(img_file_bytes)
+        size = len(img_file_bytes)
+        assert recorder.stages == [
+            ("read", size), ("upload", size), ("textract", size), ("delete", None), ("extract", None), ("parse", None)
+        ]
+        a = TextractColCedulaMRZAnalyzer(
+            FakeTextractClient(resp_json, error=Exception("throttled")), FakeS3Client(), "bucket_name",
+            ColombianMRZParser(), recorder=recorder,
+        )
+        with self.assertRaises(Exception):
+            a.analyze_document_id(img_file_bytes)
+        assert recorder.errors == [("textract", "Exception")]
+
+    def test_prometheus_recorder(self):
+        registry = CollectorRegistry()
+        recorder = PrometheusStageRecorder(registry=registry)
+        with recorder.stage("textract", 1024):
+            pass
+        with self.assertRaises(ValueError):
+            with recorder.stage("parse"):
+                raise ValueError()
+        recorder.record_document(ColombianMRZParser().parse(
+            "ICCOL000000012305001<<<<<<<<<<\n0403151F3203190C0L1234567890<0\nWALTEROS<<LAURA<<<<<<<<<<<<"
+        ))
+        assert registry.get_sample_value("mrz_analyzer_stage_seconds_count", {"stage": "textract"}) == 1
+        assert registry.get_sample_value("mrz_analyzer_stage_payload_bytes_sum", {"stage": "textract"}) == 1024
+        assert registry.get_sample_value("mrz_analyzer_stage_errors_total", {"stage": "parse", "error": "ValueError"}) == 1
+        assert registry.get_sample_value(
+            "mrz_analyzer_document_warnings_total", {"code": "COMPOSITE_CHECK_DIGIT_MISMATCH"}
+        ) == 1
+
+
+class AWSClientProviderTestCase(unittest.TestCase):
+
+    def test_clients_are_shared_and_tuned(self):
+        config = AWSClientConfig(max_pool_connections=64, retry_mode='adaptive', connect_timeout=1.5)
+        provider = AWSClientProvider(config, session=boto3.Session(
+            aws_access_key_id='fake', aws_secret_access_key='fake', region_name='us-east-1',
+        ))
+        textract_client = provider.client('textract', region_name='us-east-1')
+        assert provider.client('textract', region_name='us-east-1') is textract_client
+        assert provider.client('s3') is not textract_client
+        botocore_config = textract_client.meta.config
+        assert botocore_config.max_pool_connections == 64
+        assert botocore_config.connect_timeout == 1.5
+        assert botocore_config.retries['mode'] == 'adaptive'
+        assert botocore_config.tcp_keepalive is True
+        assert Boto3TextractClient.from_provider(provider, region_name='us-east-1')._client is textract_client
+
+
+class TextractMRZExtractionTestCase(unittest.TestCase):
+    mrz = "ICCOL000000012305001<<<<<<<<<<\n0403151F3203190C0L1234567890<0\nWALTEROS<<LAURA<<<<<<<<<<<<"
+
+    def _load_response(self):
+        with open("data/fake_1_textract_resp.json", 'rb') as f:
+            return json.load(f)
+
+    def test_extraction_reports_confidence_and_markers(self):
+        extraction = extract_mrz_from_response(self._load_response())
+        assert extraction.text == self.mrz
+        assert extraction.has_markers is True
+        assert 61.0 < extraction.confidence < 62.0
+
+    def test_extraction_uses_geometry_not_block_order(self):
+        response = self._load_response()
+        blocks = response['IdentityDocuments'][0]['Blocks']
+        blocks.reverse()
+        # A second, unrelated document with an MRZ shaped line must not be picked
+        response['IdentityDocuments'].insert(0, {'Blocks': [
+            {'BlockType': 'LINE', 'Id': 'x', 'Text': 'P<UTOERIKSSON<<ANNA<MARIA<<<<<<', 'Confidence': 99.0},
+        ]})
+        assert extract_mrz_from_response(response).text == self.mrz
+
+    def test_name_line_may_be_trimmed(self):
+        response = self._load_response()
+        for block in response['IdentityDocuments'][0]['Blocks']:
+            if block.get('Text', '').startswith('WALTEROS'):
+                block['Text'] = 'PAZ<<ANA'
+        assert extract_mrz_from_response(response).lines[2] == 'PAZ<<ANA'
+        document = TextractColCedulaMRZAnalyzer(
+            FakeTextractClient(response), FakeS3Client(), "bucket_name", ColombianMRZParser()
+        ).analyze_document_id(b'image')
+        assert (document.fields.last_names, document.fields.first_names) == ("PAZ", "ANA")
+        extraction = extract_mrz_from_response(response)
+        # The parser confidence is kept, the Textract one is reported apart
+        assert document.metadata.confidence == ColombianMRZParser().parse(extraction.text).metadata.confidence
+        assert document.metadata.ocr_confidence == extraction.confidence
+
+    def test_no_mrz_raises(self):
+        response = self._load_response()
+        response['IdentityDocuments'][0]['Blocks'] = [
+            b for b in response['IdentityDocuments'][0]['Blocks'] if not b.get('Text', '').startswith('ICCOL')
+        ]
+        with self.assertRaises(Exception):
+            extract_mrz_from_response(response)
@@ -0,0 +1,164 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+
+import bulk
+from parser.colombian_mrz_parser import ColombianMRZParser
+from scanner.analyzer import DocumentAnalyzer
+from scanner.bulk import Checkpoint, JSONLResultWriter, iter_documents, run_bulk
+from scanner.textract_replay import ReplayTextractClient, create_replay_analyzer, iter_stored_responses
+
+VALID_MRZ = "ICCOL000000012305001<<<<<<<<<<\n0403151F3203190C0L1234567890<5\nWALTEROS<<LAURA<<<<<<<<<<<<"
+
+
+class FakeMRZAnalyzer(DocumentAnalyzer):
+    """
+    The image content is the MRZ text itself
+    """
+
+    def analyze_document_id(self, file):
+        return ColombianMRZParser().parse(bytes(file).decode('utf-8'))
+
+
+def create_fake_analyzer() -> DocumentAnalyzer:
+    return FakeMRZAnalyzer()
+
+
+class BulkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.images = os.path.join(self._tmp.name, 'images')
+        os.makedirs(os.path.join(self.images, 'b'))
+        for name, content in [('a.png', VALID_MRZ), ('b/c.jpg', VALID_MRZ), ('b/bad.png', 'garbage'),
+                              ('notes.txt', VALID_MRZ)]:
+            with open(os.path.join(self.images, name), 'w') as f:
+                f.write(content)
+        self.output = os.path.join(self._tmp.name, 'results.jsonl')
+
+    def _run(self, source, use_processes=False, retry_failed=False):
+        checkpoint = Checkpoint(self.output + '.checkpoint', retry_failed=retry_failed)
+        try:
+            return run_bulk(iter_documents(source, skip=checkpoint.is_done), create_fake_analyzer,
+                            JSONLResultWriter(self.output), checkpoint=checkpoint, use_processes=use_processes,
+                            workers=2)
+        finally:
+            checkpoint.close()
+
+    def _read_output(self):
+        with open(self.output) as f:
+            return {r["filename"]: r for r in map(json.loads, f)}
+
+    def test_directory_with_threads_and_resume(self):
+        stats = self._run(self.images)
+        assert (stats.analyzed, stats.failed) == (2, 1)
+        results = self._read_output()
+        assert sorted(results) == ['a.png', os.path.join('b', 'bad.png'), os.path.join('b', 'c.jpg')]
+        assert results['a.png']["result"]["fields"]["nuip"] == "1234567890"
+        # A crash left half a line, it is dropped and nothing already written is analyzed again
+        with open(self.output, 'a') as f:
+            f.write('{"filename": "trunc')
+        stats = self._run(self.images)
+        assert (stats.analyzed, stats.failed) == (0, 0)
+        assert len(self._read_output()) == 3
+        stats = self._run(self.images, retry_failed=True)
+        assert (stats.analyzed, stats.failed) == (0, 1)
+
+    def test_resume_after_a_hard_crash_skips_every_written_result(self):
+        source = os.path.join(self._tmp.name, 'many')
+        os.makedirs(source)
+        for i in range(200):
+            with open(os.path.join(source, f'scan_{i:03d}.png'), 'w') as f:
+                f.write(VALID_MRZ)
+        # Killed without closing anything, only what Python's buffer flushed reached the output
+        script = (
+            "import os\n"
+            "from test_bulk import create_fake_analyzer\n"
+            "from scanner.bulk import Checkpoint, JSONLResultWriter, iter_documents, run_bulk\n"
+            "written = []\n"
+            "def crash(record):\n"
+            "    written.append(record)\n"
+            "    if len(written) == 150:\n"
+            "        os._exit(1)\n"
+            f"checkpoint = Checkpoint({self.output + '.checkpoint'!r})\n"
+            f"run_bulk(iter_documents({source!r}, skip=checkpoint.is_done), create_fake_analyzer,\n"
+            f"         JSONLResultWriter({self.output!r}), checkpoint=checkpoint, workers=2, on_record=crash)\n"
+        )
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.abspath('..'), os.path.abspath('.')]))
+        proc = subprocess.run([sys.executable, '-c', script], env=env)
+        assert proc.returncode == 1
+        with open(self.output, 'rb') as f:
+            written = f.read().count(b'\n')
+        # More than the 100 checkpointed after the first fsync
+        assert 100 < written <= 150
+        stats = self._run(source)
+        assert stats.analyzed == 200 - written
+        with open(self.output) as f:
+            names = [json.loads(line)["filename"] for line in f]
+        assert len(names) == 200 and len(set(names)) == 200
+
+    def test_jsonl_writer_is_durable_once_synced(self):
+        writer = JSONLResultWriter(self.output, sync_every=2)
+        records = [{"filename": str(i), "status": 200, "result": None} for i in range(3)]
+        assert [writer.write(record) for record in records] == [False, True, False]
+        writer.close()
+        assert len(self._read_output()) == 3
+
+    def test_tar_with_processes(self):
+        archive = os.path.join(self._tmp.name, 'images.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            for i in range(5):
+                data = VALID_MRZ.encode('utf-8')
+                info = tarfile.TarInfo(f'scan_{i}.png')
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        stats = self._run(archive, use_processes=True)
+        assert (stats.analyzed, stats.failed) == (5, 0)
+        assert len(self._read_output()) == 5
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        with open('data/fake_1_textract_resp.json', 'rb') as f:
+            self.response = json.loads(f.read())
+
+    def test_ndjson_with_processes(self):
+        source = os.path.join(self._tmp.name, 'responses.ndjson')
+        with open(source, 'w') as f:
+            f.write(json.dumps(self.response) + '\n\n')
+            f.write(json.dumps({"filename": "fake_1.png", "response": self.response}) + '\n')
+            f.write(json.dumps({"IdentityDocuments": []}))
+        output = os.path.join(self._tmp.name, 'results.jsonl')
+        stats = run_bulk(iter_stored_responses(source), create_replay_analyzer, JSONLResultWriter(output),
+                         use_processes=True, workers=2)
+        assert (stats.analyzed, stats.failed) == (2, 1)
+        with open(output) as f:
+            results = {r["filename"]: r for r in map(json.loads, f)}
+        assert sorted(results) == ['fake_1.png', 'responses.ndjson:1', 'responses.ndjson:4']
+        assert results['responses.ndjson:1']["result"] == results['fake_1.png']["result"]
+        assert results['responses.ndjson:1']["result"]["fields"]["nuip"] == "1234567890"
+        assert results['responses.ndjson:4']["status"] == 422
+
+    def test_cli_exits_with_failure_status(self):
+        source = os.path.join(self._tmp.name, 'responses')
+        os.makedirs(source)
+        with open(os.path.join(source, 'fake_1.json'), 'w') as f:
+            json.dump(self.response, f)
+        output = os.path.join(self._tmp.name, 'results.jsonl')
+        assert bulk.main([source, '-o', output, '--backend', 'replay', '--executor', 'thread']) == 0
+        with open(os.path.join(source, 'blank.json'), 'w') as f:
+            json.dump({"IdentityDocuments": []}, f)
+        assert bulk.main([source, '-o', output, '--backend', 'replay', '--executor', 'thread']) == 1
+
+    def test_client_reads_stored_response_by_name(self):
+        client = ReplayTextractClient('data')
+        assert client.analyze_id('fake_1_textract_resp.json', 'ignored') == self.response
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from dataclasses import FrozenInstanceError, replace
+
+from domain.model import Document, DocumentMetadata
+from parser.colombian_mrz_parser import ColombianMRZParser
+from parser.mrz_correction import MRZCorrector
+from scanner.analyzer import AsyncDocumentAnalyzer, DocumentAnalyzer, LazyAsyncDocumentAnalyzer
+from scanner.cache import AsyncCachingDocumentAnalyzer, CachingDocumentAnalyzer, LRUResultCache, SQLiteResultCache, content_key
+from scanner.single_flight import AsyncSingleFlightDocumentAnalyzer, SingleFlightDocumentAnalyzer
+
+
+VALID_MRZ = "ICCOL000000012305001<<<<<<<<<<\n0403151F3203190C0L1234567890<5\nWALTEROS<<LAURA<<<<<<<<<<<<"
+
+
+def document_for(file: bytes) -> Document:
+    """
+    A parsed Document whose lines tell which file it was made for
+    """
+    document = ColombianMRZParser().parse(VALID_MRZ)
+    return replace(document, metadata=DocumentMetadata(lines=(bytes(file).decode(),), confidence=100.0))
+
+
+class CountingAnalyzer(DocumentAnalyzer):
+
+    def __init__(self):
+        self.calls = 0
+
+    def analyze_document_id(self, file: bytes) -> Document:
+        self.calls += 1
+        return document_for(file)
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def test_lru_evicts_least_recently_used_and_expired_entries(self):
+        now = [0.0]
+        cache = LRUResultCache(max_entries=2, ttl=10, clock=lambda: now[0])
+        a = CountingAnalyzer().analyze_document_id(b'a')
+        cache.set('a', a)
+        cache.set('b', a)
+        assert cache.get('a') is a
+        cache.set('c', a)
+        assert cache.get('b') is None
+        assert cache.get('a') is a
+        now[0] = 11.0
+        assert cache.get('a') is None
+        assert len(cache) == 1
+
+    def test_caching_analyzer_counts_hits_and_misses(self):
+        inner = CountingAnalyzer()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SQLiteResultCache(os.path.join(tmp, 'cache.sqlite'))
+            analyzer = CachingDocumentAnalyzer(inner, cache)
+            first = analyzer.analyze_document_id(b'image')
+            second = analyzer.analyze_document_id(b'image')
+            analyzer.analyze_document_id(b'other')
+            cache.close()
+        assert inner.calls == 2
+        assert second == first
+        assert analyzer.stats.hits == 1
+        assert analyzer.stats.misses == 2
+        assert content_key(b'image') != content_key(b'other')
+
+    def test_sqlite_cache_stores_json_not_pickles(self):
+        mrz_parser = ColombianMRZParser(corrector=MRZCorrector())
+        document = mrz_parser.parse(VALID_MRZ.replace("05001<", "O5OO1<").replace("<5\n", "<0\n"))
+        assert document.metadata.corrections and document.fields.errors
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.sqlite')
+            cache = SQLiteResultCache(path)
+            cache.set('doc', document)
+            assert cache.get('doc') == document
+            with sqlite3.connect(path) as conn:
+                conn.execute('UPDATE results SET value = ? WHERE key = ?', (pickle.dumps(document), 'doc'))
+            assert cache.get('doc') is None
+            cache.close()
+
+    def test_cached_documents_cannot_be_mutated(self):
+        cache = LRUResultCache()
+        cache.set('a', document_for(b'a'))
+        with self.assertRaises(FrozenInstanceError):
+            cache.get('a').metadata.confidence = 0.0
+        assert cache.get('a').metadata.confidence == 100.0
+
+
+class BlockingAnalyzer(CountingAnalyzer):
+    """
+    Holds every analysis until release is set
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def analyze_document_id(self, file: bytes) -> Document:
+        self.started.set()
+        self.release.wait(5)
+        return super().analyze_document_id(bytes(file))
+
+
+class AsyncCountingAnalyzer(AsyncDocumentAnalyzer):
+
+    def __init__(self):
+        self.calls = 0
+        self.closed = False
+
+    async def analyze_document_id(self, file: bytes) -> Document:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if file == b'bad':
+            raise Exception('No document detected')
+        return document_for(file)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def test_concurrent_identical_calls_share_one_analysis(self):
+        inner = BlockingAnalyzer()
+        analyzer = SingleFlightDocumentAnalyzer(inner)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(analyzer.analyze_document_id(b'image')))
+                   for _ in range(4)]
+        threads[0].start()
+        inner.started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Give the followers time to find the analysis in flight
+        threading.Event().wait(0.2)
+        inner.release.set()
+        for thread in threads:
+            thread.join(5)
+        assert inner.calls == 1
+        assert len(results) == 4 and all(r is results[0] for r in results)
+        # Nothing is kept once the analysis is over
+        analyzer.analyze_document_id(b'image')
+        assert inner.calls == 2
+
+    def test_async_calls_share_results_and_errors(self):
+        inner = AsyncCountingAnalyzer()
+        analyzer = AsyncSingleFlightDocumentAnalyzer(inner)
+
+        async def run():
+            return await asyncio.gather(
+                *(analyzer.analyze_document_id(content) for content in [b'a', b'a', b'b', b'bad', b'bad']),
+                return_exceptions=True,
+            )
+
+        first, second, other, error, same_error = asyncio.run(run())
+        assert inner.calls == 3
+        assert first is second and other is not first
+        assert str(error) == 'No document detected' and same_error is error
+
+    def test_async_chain_builds_lazily_caches_and_closes(self):
+        inner = AsyncCountingAnalyzer()
+
+        async def factory():
+            return inner
+
+        analyzer = AsyncCachingDocumentAnalyzer(
+            AsyncSingleFlightDocumentAnalyzer(LazyAsyncDocumentAnalyzer(factory)), LRUResultCache()
+        )
+
+        async def run():
+            first = await analyzer.analyze_document_id(b'image')
+            second = await analyzer.analyze_document_id(b'image')
+            await analyzer.aclose()
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert inner.calls == 1 and second == first
+        assert analyzer.stats.hits == 1 and analyzer.stats.misses == 1
+        assert inner.closed
@@ -0,0 +1,59 @@
+import shutil
+import unittest
+
+import cv2
+
+from parser.colombian_mrz_parser import ColombianMRZParser
+from scanner.local_analyzer import LocalMRZAnalyzer
+from scanner.mrz_region import MRZRegionDetector
+
+
+class LocalAnalyzerTestCase(unittest.TestCase):
+
+    def test_crops_mrz_band(self):
+        detector = MRZRegionDetector()
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        image = detector.decode(img_file_bytes)
+        band = detector.crop(image)
+        height, width = image.shape
+        assert band.shape[1] > width * 0.6
+        assert band.shape[0] < height * 0.4
+        png = detector.crop_to_png(img_file_bytes)
+        assert png.startswith(b'\x89PNG')
+        assert len(png) < len(img_file_bytes)
+
+    def test_crop_deskews_and_downsamples(self):
+        detector = MRZRegionDetector(target_height=100)
+        with open("data/fake_1.png", 'rb') as f:
+            image = detector.decode(f.read())
+        image = cv2.resize(image, None, fx=4, fy=4)
+        height, width = image.shape
+        rotation = cv2.getRotationMatrix2D((width / 2, height / 2), 6, 1)
+        image = cv2.warpAffine(image, rotation, (width, height), borderValue=255)
+        _, _, angle = detector.locate(image)
+        assert abs(angle + 6) < 1.5, angle
+        assert detector.crop(image).shape[0] <= 100
+
+    def test_front_has_no_mrz_band(self):
+        with open("data/fake_1_front.png", 'rb') as f:
+            assert MRZRegionDetector().crop_to_png(f.read()) is None
+
+    def test_extracts_mrz_lines_from_ocr_text(self):
+        text = "REGISTRADOR\nICCOL000000012305001<<<<<<<<<<\n0403151F3203190COL1234567890<0\nWALTEROS<<LAURA<<<<<<<<<<<<\n"
+        mrz = LocalMRZAnalyzer._extract_mrz_text_from_ocr(text)
+        assert mrz.split('\n') == [
+            "ICCOL000000012305001<<<<<<<<<<",
+            "0403151F3203190COL1234567890<0",
+            "WALTEROS<<LAURA<<<<<<<<<<<<<<<",
+        ]
+
+    def test_analyzer_with_tesseract(self):
+        if shutil.which('tesseract') is None:
+            self.skipTest("tesseract not installed")
+            return
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        doc = LocalMRZAnalyzer(ColombianMRZParser()).analyze_document_id(img_file_bytes)
+        assert doc.fields.nuip == "1234567890"
+        assert doc.fields.last_names == "WALTEROS"
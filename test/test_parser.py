@@ -0,0 +1,211 @@
+import datetime
+import unittest
+
+import numpy
+
+from domain.model import ErrorCode, MRZError
+from parser.colombian_mrz_parser import CORRECTION_CONFIDENCE_PENALTY, ColombianMRZParser
+from parser.country_table import get_country_table
+from parser.locality_registry import get_locality_registry
+from parser.mrz_correction import MRZCorrector
+from parser.mrz_dates import MRZDateDecoder
+from parser.mrz_parser import CheckDigitCalculator
+from synthetic import SyntheticCedulaGenerator
+
+
+class LocalityRegistryTestCase(unittest.TestCase):
+
+    def test_lookup_by_codes_and_reverse_indexes(self):
+        registry = get_locality_registry()
+        loc = registry.get("05", "001")
+        assert loc is not None
+        assert loc.mun_name == "BOLIVAR"
+        assert loc.dep_name == "CARTAGENA"
+        assert registry.get("05", "999") is None
+        assert loc in registry.by_mun_code("05")
+        assert all(l.mun_code == "05" for l in registry.by_mun_code("05"))
+        assert loc in registry.by_name("cartagena")
+        assert registry.by_name("NOT A PLACE") == ()
+
+
+class CountryTableTestCase(unittest.TestCase):
+
+    def test_ocr_confusions_are_folded_into_the_keys(self):
+        table = get_country_table()
+        assert table.get("COL").name == "COLOMBIA"
+        assert table.get("C0L") is table.get("COL")
+        assert table.get("80L").code == "BOL"
+        assert table.get("c0l").code == "COL"
+        assert table.get("XX<") is None
+
+    def test_unknown_country_is_reported_not_raised(self):
+        doc = ColombianMRZParser().parse(BatchParserTestCase.valid_mrz.replace("ICCOL", "ICXX<"))
+        assert doc.fields.country_code == "XX<"
+        assert doc.fields.country_name == ""
+        assert [e.code for e in doc.fields.errors] == [ErrorCode.INVALID_COUNTRY]
+
+
+class BatchParserTestCase(unittest.TestCase):
+    # As printed on data/fake_1.png, the TD1 composite digit reads 0 where 5 is expected
+    card_mrz = "ICCOL000000012305001<<<<<<<<<<\n0403151F3203190C0L1234567890<0\nWALTEROS<<LAURA<<<<<<<<<<<<"
+    # Same card with a consistent composite digit, for the checks that rely on it (OCR correction)
+    valid_mrz = "ICCOL000000012305001<<<<<<<<<<\n0403151F3203190C0L1234567890<5\nWALTEROS<<LAURA<<<<<<<<<<<<"
+    invalid_mrz = "ICCOL000000012405001<<<<<<<<<<\n0413151F3202190C0L1234567890<0\nWALTEROS<<LAURA<<<<<<<<<<<<"
+
+    def test_parse_batch_matches_scalar_parser(self):
+        mrz_parser = ColombianMRZParser()
+        batch = mrz_parser.parse_batch([self.valid_mrz, self.invalid_mrz], with_documents=True)
+        doc = mrz_parser.parse(self.valid_mrz)
+        assert len(batch) == 2
+        assert list(batch.valid) == [True, False]
+        assert batch.doc_number[0] == doc.fields.doc_number
+        assert batch.bird_date[0] == numpy.datetime64(doc.fields.bird_date)
+        assert batch.expiration_date[0] == numpy.datetime64(doc.fields.expiration_date)
+        assert numpy.isnat(batch.bird_date[1])
+        assert batch.mun_name[0] == doc.fields.mun_name
+        assert batch.dep_name[0] == doc.fields.dep_name
+        assert batch.nationality_country_name[0] == doc.fields.nationality_country_name
+        assert batch.first_names[0] == doc.fields.first_names
+        assert batch.documents[0] == doc
+
+    def test_batch_validity_agrees_with_document_errors(self):
+        mrzs = [
+            self.valid_mrz,
+            self.valid_mrz.replace("5678", "S678"),
+            self.valid_mrz.replace("0C0L", "0XXX"),
+            self.valid_mrz.replace("ICCOL", "ICXX<"),
+            self.valid_mrz.replace("ICCOL", "XCCOL"),
+            self.valid_mrz.replace("000000012", "000000000"),
+        ]
+        batch = ColombianMRZParser().parse_batch(mrzs, with_documents=True)
+        assert list(batch.valid) == [doc.fields.errors == () for doc in batch.documents]
+        assert list(batch.valid) == [True, False, False, False, False, False]
+        assert not batch.nuip_valid[1] and not batch.nationality_valid[2]
+        assert not batch.country_valid[3] and not batch.doc_type_valid[4] and not batch.doc_number_valid[5]
+
+    def test_parse_empty_batch(self):
+        batch = ColombianMRZParser().parse_batch([], with_documents=True)
+        assert len(batch) == 0 and len(batch.valid) == 0
+        assert batch.documents == []
+
+    def test_parse_batch_accepts_line_matrix(self):
+        lines = numpy.array([self.valid_mrz.split('\n')] * 4)
+        batch = ColombianMRZParser().parse_batch(lines)
+        assert batch.valid.all()
+        assert batch.documents is None
+
+
+class CheckDigitTestCase(unittest.TestCase):
+
+    def test_check_digit(self):
+        assert CheckDigitCalculator.compute_check_digit("040315") == "1"
+        assert CheckDigitCalculator.compute_check_digit("12") == "3"
+        assert CheckDigitCalculator.compute_check_digit("L898902C<") == "3"
+        assert CheckDigitCalculator.compute_check_digit("") == "0"
+
+    def test_composite_check_digit_mismatch_is_a_warning(self):
+        mrz_parser = ColombianMRZParser()
+        valid = mrz_parser.parse(BatchParserTestCase.valid_mrz)
+        assert valid.fields.errors == () and valid.fields.warnings == ()
+        card = mrz_parser.parse(BatchParserTestCase.card_mrz)
+        assert card.fields.errors == ()
+        assert card.fields.warnings == (MRZError(ErrorCode.COMPOSITE_CHECK_DIGIT_MISMATCH, ("0", "5")),)
+        assert card.metadata.confidence == valid.metadata.confidence
+        assert ColombianMRZParser().parse_batch([BatchParserTestCase.card_mrz]).valid.all()
+
+    def test_check_digit_weights_only_icao_chars(self):
+        assert CheckDigitCalculator.compute_check_digit("04Ñ315") == CheckDigitCalculator.compute_check_digit("04<315")
+        assert CheckDigitCalculator.compute_check_digit("04€315") == CheckDigitCalculator.compute_check_digit("04<315")
+
+
+class DateParserTestCase(unittest.TestCase):
+
+    def test_parse_date_returns_errors_instead_of_raising(self):
+        assert ColombianMRZParser._parse_date("040315", "1", True, "bird_date") == (datetime.date(2004, 3, 15), None)
+        date, error = ColombianMRZParser._parse_date("040230", "1", True, "bird_date")
+        assert date is None and error.code == ErrorCode.INVALID_DATE
+        date, error = ColombianMRZParser._parse_date("O40315", "1", True, "bird_date")
+        assert date is None and error.code == ErrorCode.DATE_YEAR_NOT_NUMERIC
+        date, error = ColombianMRZParser._parse_date("040315", "2", True, "bird_date")
+        assert error.code == ErrorCode.DATE_CHECK_DIGIT_MISMATCH and error.args == ("bird_date", "2", "1")
+
+    def test_unknown_locality_and_missing_first_names_are_reported_not_raised(self):
+        mrz_parser = ColombianMRZParser()
+        for locality in ("99999", "O5OO1"):
+            doc = mrz_parser.parse(BatchParserTestCase.valid_mrz.replace("05001", locality))
+            assert MRZError(ErrorCode.INVALID_LOCALITY, (locality[0:2], locality[2:5])) in doc.fields.errors
+            assert doc.fields.mun_name == ""
+        doc = mrz_parser.parse("ICCOL000000012305001<<<<<<<<<<\n0403151F320319\nWALTEROS<<LAURA")
+        assert doc.fields.errors[0] == MRZError(ErrorCode.LINE_TOO_SHORT, (2, 14))
+        assert doc.fields.bird_date == datetime.date(2004, 3, 15)
+        assert ErrorCode.NUIP_NOT_NUMERIC in [e.code for e in doc.fields.errors]
+        assert [e.code for e in doc.fields.warnings] == [ErrorCode.COMPOSITE_CHECK_DIGIT_MISSING]
+        assert not mrz_parser.parse_batch(["\n".join(doc.metadata.lines)]).valid[0]
+        doc = mrz_parser.parse(BatchParserTestCase.valid_mrz.replace("WALTEROS<<LAURA", "WALTEROSLAURA<<"))
+        assert doc.fields.last_names == "WALTEROSLAURA"
+        assert doc.fields.first_names == ""
+        assert doc.fields.is_truncated
+
+    def test_date_decoder_uses_injected_clock_and_memoizes(self):
+        decoder = MRZDateDecoder(clock=lambda: datetime.date(2003, 6, 1))
+        assert decoder.decode("040315", True).date == datetime.date(1904, 3, 15)
+        assert decoder.decode("040315", False).date == datetime.date(2004, 3, 15)
+        assert decoder.decode("040315", True) is decoder.decode("040315", True)
+        assert decoder.decode("041315", True).error == ErrorCode.INVALID_DATE
+        assert decoder.decode("O40315", True).error == ErrorCode.DATE_YEAR_NOT_NUMERIC
+        assert decoder.cache_size() == 2
+        assert ColombianMRZParser.date_decoder is None
+
+
+class MRZCorrectorTestCase(unittest.TestCase):
+    valid_mrz = BatchParserTestCase.valid_mrz
+
+    def test_letters_in_numeric_fields_are_coerced(self):
+        mrz_parser = ColombianMRZParser(corrector=MRZCorrector())
+        doc = mrz_parser.parse(self.valid_mrz.replace("05001<", "O5OO1<").replace("0403151F", "04O3151F"))
+        assert doc.fields.errors == ()
+        assert doc.fields.mun_name == "BOLIVAR"
+        assert [(c.line, c.position, c.original) for c in doc.metadata.corrections] == [
+            (0, 15, "O"), (0, 17, "O"), (0, 18, "O"), (1, 2, "O")
+        ]
+        assert doc.metadata.lines[0] == self.valid_mrz.split("\n")[0]
+        assert doc.metadata.confidence < mrz_parser.parse(self.valid_mrz).metadata.confidence
+
+    def test_digit_confusions_need_check_digits_to_agree(self):
+        mrz_parser = ColombianMRZParser(corrector=MRZCorrector())
+        doc = mrz_parser.parse(self.valid_mrz.replace("0403151F", "0408151F"))
+        assert doc.fields.errors == ()
+        assert doc.fields.bird_date == datetime.date(2004, 3, 15)
+        # The composite digit is wrong as well, nothing confirms the candidate so nothing is changed
+        doc = mrz_parser.parse(self.valid_mrz.replace("0403151F", "0408151F").replace("<5\n", "<0\n"))
+        assert doc.metadata.corrections == ()
+        assert doc.fields.bird_date is None
+
+    def test_unconfirmed_letters_are_only_suggested(self):
+        mrz_parser = ColombianMRZParser(corrector=MRZCorrector())
+        # The card composite digit is wrong, only the bird date check digit confirms its fix
+        doc = mrz_parser.parse(BatchParserTestCase.card_mrz.replace("04031", "O4031").replace("5678", "S678"))
+        assert doc.fields.bird_date == datetime.date(2004, 3, 15)
+        assert doc.fields.nuip == "1234S67890"
+        assert [e.code for e in doc.fields.errors] == [ErrorCode.NUIP_NOT_NUMERIC]
+        assert [(c.position, c.original, c.applied) for c in doc.metadata.corrections] == [
+            (0, "O", True), (22, "S", False)
+        ]
+        assert doc.metadata.confidence == 100.0 - CORRECTION_CONFIDENCE_PENALTY - 30.0
+
+    def test_clean_mrz_is_untouched(self):
+        doc = ColombianMRZParser(corrector=MRZCorrector()).parse(self.valid_mrz)
+        assert doc.metadata.corrections == ()
+        assert doc.fields.errors == ()
+
+
+class SyntheticCedulaTestCase(unittest.TestCase):
+
+    def test_generated_mrzs_are_valid_and_corruptions_are_detected(self):
+        generator = SyntheticCedulaGenerator(seed=1)
+        mrz_parser = ColombianMRZParser()
+        for mrz in generator.batch(50):
+            assert mrz_parser.parse(mrz).fields.errors == (), mrz
+        documents = [mrz_parser.parse(mrz) for mrz in generator.batch(50, corrupted_ratio=1.0)]
+        rejected = sum(bool(doc.fields.errors or doc.fields.warnings) for doc in documents)
+        assert rejected >= 45
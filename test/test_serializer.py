@@ -0,0 +1,27 @@
+import json
+import unittest
+
+from domain import serializer
+from domain.model import ErrorCode
+from parser.colombian_mrz_parser import ColombianMRZParser
+
+
+class SerializerTestCase(unittest.TestCase):
+    invalid_mrz = "ICCOL000000012405001<<<<<<<<<<\n0413151F3203190C0L1234567890<5\nWALTEROS<<LAURA<<<<<<<<<<<<"
+
+    def test_dates_as_iso_and_errors_as_codes(self):
+        doc = ColombianMRZParser().parse(self.invalid_mrz)
+        data = json.loads(serializer.dumps({"result": doc}))["result"]
+        assert list(data) == ["fields", "metadata"]
+        assert data["fields"]["expiration_date"] == doc.fields.expiration_date.isoformat()
+        assert data["fields"]["bird_date"] is None
+        assert data["fields"]["sex"] == "F"
+        codes = [e["code"] for e in data["fields"]["errors"]]
+        assert ErrorCode.DOC_NUMBER_CHECK_DIGIT_MISMATCH.name in codes
+        assert ErrorCode.INVALID_DATE.name in codes
+        assert data["metadata"]["lines"] == list(doc.metadata.lines)
+
+    def test_output_is_deterministic(self):
+        doc = ColombianMRZParser().parse(self.invalid_mrz)
+        assert serializer.dumps(doc) == serializer.dumps(doc)
+        assert json.loads(serializer.dumps(doc)) == serializer.document_to_dict(doc)
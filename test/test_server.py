@@ -0,0 +1,161 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+import zipfile
+from unittest import mock
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from parser.colombian_mrz_parser import ColombianMRZParser
+from scanner.single_flight import AsyncSingleFlightDocumentAnalyzer
+from scanner.textract_analyzer import AsyncTextractColCedulaMRZAnalyzer, TextractColCedulaMRZAnalyzer
+from scanner.worker_pool import BoundedWorkerPool
+from scanner.factories import create_analyzer
+from server import BATCH_MAX_FILES, MAX_UPLOAD_BYTES, BodySizeLimitMiddleware, create_app
+from test_analyzer import FakeAsyncS3Client, FakeAsyncTextractClient, FakeTextractClient, FakeS3Client
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_times(module: str) -> dict:
+    """
+    :return: module name -> cumulative import time in microseconds, from python -X importtime
+    """
+    env = {k: v for k, v in os.environ.items() if not k.startswith('AWS_')}
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def _create_app(self):
+        with open("data/fake_1_textract_resp.json", 'rb') as f:
+            resp_json = json.load(f)
+        return create_app(
+            analyzer_factory=lambda: TextractColCedulaMRZAnalyzer(
+                FakeTextractClient(resp_json), FakeS3Client(), "bucket_name", ColombianMRZParser()
+            ),
+            worker_pool_factory=lambda: BoundedWorkerPool(2, 2),
+        )
+
+    def test_analyze(self):
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        with TestClient(self._create_app()) as client:
+            resp = client.post("/analyze", files={"file": ("fake_1.png", img_file_bytes)})
+            assert resp.status_code == 200
+            assert resp.json()["result"]["fields"]["nuip"] == "1234567890"
+            resp = client.post("/analyze", files={"file": ("empty.png", b"")})
+            assert resp.status_code == 400
+            resp = client.post("/analyze", files={"file": ("big.png", b"0" * (MAX_UPLOAD_BYTES + 1))})
+            assert resp.status_code == 413
+
+    def test_body_limit_applies_to_streamed_bodies(self):
+        app = FastAPI()
+        app.add_middleware(BodySizeLimitMiddleware, max_body_size=1024)
+
+        @app.post("/upload")
+        async def upload(file: UploadFile = File(...)):
+            return {"size": len(await file.read())}
+
+        def chunks(size):
+            # No Content-Length, the body is sent chunked
+            body = (b'--boundary\r\nContent-Disposition: form-data; name="file"; filename="a.png"\r\n\r\n'
+                    + b"0" * size + b"\r\n--boundary--\r\n")
+            for i in range(0, len(body), 256):
+                yield body[i:i + 256]
+
+        headers = {"content-type": "multipart/form-data; boundary=boundary"}
+        with TestClient(app) as client:
+            resp = client.post("/upload", content=chunks(100), headers=headers)
+            assert resp.status_code == 200 and resp.json() == {"size": 100}
+            resp = client.post("/upload", content=chunks(4096), headers=headers)
+            assert resp.status_code == 413
+            assert resp.json() == {"result": "file too big"}
+
+    def test_metrics(self):
+        with TestClient(self._create_app()) as client:
+            resp = client.get("/metrics")
+            assert resp.status_code == 200
+            assert resp.headers["content-type"].startswith("text/plain")
+
+    def test_analyze_batch_streams_one_line_per_file(self):
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        with TestClient(self._create_app()) as client:
+            resp = client.post("/analyze/batch", files=[
+                ("files", ("fake_1.png", img_file_bytes)),
+                ("files", ("empty.png", b"")),
+                ("files", ("fake_2.png", img_file_bytes)),
+            ])
+            assert resp.status_code == 200
+            results = sorted((json.loads(line) for line in resp.text.splitlines()), key=lambda r: r["index"])
+            assert [r["status"] for r in results] == [200, 400, 200]
+            assert results[2]["result"]["fields"]["nuip"] == "1234567890"
+
+    def test_analyze_batch_limits_zip_entries_before_decompressing(self):
+        def zip_of(count):
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for i in range(count):
+                    archive.writestr(f"scan_{i}.png", b"0" * 1024)
+            return buffer.getvalue()
+
+        with TestClient(self._create_app()) as client:
+            resp = client.post("/analyze/batch", files=[
+                ("files", ("scans.zip", zip_of(2))),
+                ("files", ("empty.png", b"")),
+            ])
+            assert resp.status_code == 200
+            assert sorted(json.loads(line)["filename"] for line in resp.text.splitlines()) == [
+                "empty.png", "scans.zip/scan_0.png", "scans.zip/scan_1.png"
+            ]
+            resp = client.post("/analyze/batch", files=[("files", ("scans.zip", zip_of(BATCH_MAX_FILES + 1)))])
+            assert resp.status_code == 413
+
+    def test_analyze_with_async_analyzer(self):
+        with open("data/fake_1_textract_resp.json", 'rb') as f:
+            resp_json = json.load(f)
+        with open("data/fake_1.png", 'rb') as f:
+            img_file_bytes = f.read()
+        app = create_app(
+            analyzer_factory=lambda: AsyncTextractColCedulaMRZAnalyzer(
+                FakeAsyncTextractClient(resp_json), FakeAsyncS3Client(), "bucket_name", ColombianMRZParser()
+            ),
+            worker_pool_factory=lambda: BoundedWorkerPool(2, 2),
+        )
+        with TestClient(app) as client:
+            resp = client.post("/analyze", files={"file": ("fake_1.png", img_file_bytes)})
+            assert resp.status_code == 200
+            assert resp.json()["result"]["fields"]["nuip"] == "1234567890"
+
+    def test_async_backend_is_built_on_first_analysis(self):
+        with mock.patch.dict(os.environ, {"ANALYZER_BACKEND": "textract-async", "ANALYZER_CACHE_SIZE": "0"}):
+            analyzer = create_analyzer()
+        assert isinstance(analyzer, AsyncSingleFlightDocumentAnalyzer)
+
+    def test_import_does_not_build_clients_or_load_tables(self):
+        for module in ('server', 'parser.colombian_mrz_parser'):
+            times = _import_times(module)
+            for heavy in ('boto3', 'botocore', 'iso3166', 'parser.locatilities', 'numpy', 'cv2'):
+                assert heavy not in times, f'{module} imports {heavy}'
+        # The CLI and its worker processes never load the web app
+        for module in ('bulk', 'scanner.factories'):
+            times = _import_times(module)
+            assert 'fastapi' not in times and 'server' not in times, f'{module} imports the web app'
+        # generous budget, fastapi alone takes most of it
+        assert _import_times('parser.colombian_mrz_parser')['parser.colombian_mrz_parser'] < 500_000
+        assert _import_times('server')['server'] < 3_000_000
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import unittest
+
+from scanner.worker_pool import BoundedWorkerPool, WorkerPoolSaturatedError
+
+
+class BoundedWorkerPoolTestCase(unittest.TestCase):
+
+    def test_rejects_calls_when_saturated(self):
+        release = threading.Event()
+
+        async def scenario():
+            pool = BoundedWorkerPool(max_workers=1, max_queue=1)
+            running = asyncio.ensure_future(pool.run(release.wait))
+            queued = asyncio.ensure_future(pool.run(release.wait))
+            await asyncio.sleep(0)
+            assert pool.pending == 2
+            assert pool.queued == 1
+            with self.assertRaises(WorkerPoolSaturatedError):
+                await pool.run(release.wait)
+            release.set()
+            await asyncio.gather(running, queued)
+            assert pool.pending == 0
+            assert await pool.run(sum, [1, 2]) == 3
+            pool.shutdown()
+
+        asyncio.run(scenario())
+
+    def test_cancelled_call_holds_its_slot_until_the_thread_is_done(self):
+        release = threading.Event()
+
+        async def scenario():
+            pool = BoundedWorkerPool(max_workers=1, max_queue=0)
+            running = asyncio.ensure_future(pool.run(release.wait))
+            await asyncio.sleep(0.05)
+            running.cancel()
+            await asyncio.sleep(0)
+            assert running.cancelled()
+            # The thread is still blocked on release
+            assert pool.pending == 1
+            with self.assertRaises(WorkerPoolSaturatedError):
+                await pool.run(release.wait)
+            release.set()
+            for _ in range(100):
+                if pool.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert pool.pending == 0
+            assert await pool.run(sum, [1, 2]) == 3
+            pool.shutdown()
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            release.set()